@@ -451,6 +451,13 @@ except ImportError as e:
     logger.error(f"❌ Failed to import response_generation_node: {e}")
     raise
 
+try:
+    from chatbot.memory import memory_node
+    logger.info("✅ Imported memory_node")
+except ImportError as e:
+    logger.error(f"❌ Failed to import memory_node: {e}")
+    raise
+
 
 # =====================================
 # DATABASE CONNECTION
@@ -572,9 +579,10 @@ def intent_router(state: State) -> str:
 # =====================================
 # BUILD THE LANGGRAPH
 # =====================================
-def build_graph():
+def build_graph(checkpointer=None):
     """
-    Build and compile the LangGraph workflow with comprehensive error handling
+    Build and compile the LangGraph workflow with comprehensive error handling.
+    With a `checkpointer` (see chatbot.memory), state is kept per thread_id between calls.
     """
     logger.info("="*60)
     logger.info("Building chatbot graph...")
@@ -598,6 +606,7 @@ def build_graph():
             ("db_query_node", db_query_node_wrapper),
             ("education_node", education_node),
             ("response_generation_node", response_generation_node),
+            ("memory_node", memory_node),
         ]
         
         for node_name, node_func in nodes_to_register:
@@ -665,20 +674,23 @@ def build_graph():
         # TERMINAL EDGES
         # =====================================
         
-        # Emergency node exits immediately (CRITICAL!)
-        graph.add_edge("emergency_node", END)
-        logger.debug("✅ emergency_node → END")
+        # Emergency node exits immediately (CRITICAL!), only recording the turn
+        graph.add_edge("emergency_node", "memory_node")
+        logger.debug("✅ emergency_node → memory_node")
         
-        # Response generator is final step
-        graph.add_edge("response_generation_node", END)
-        logger.debug("✅ response_generation_node → END")
+        # Response generator is the last step before the turn is recorded
+        graph.add_edge("response_generation_node", "memory_node")
+        logger.debug("✅ response_generation_node → memory_node")
+
+        graph.add_edge("memory_node", END)
+        logger.debug("✅ memory_node → END")
 
         logger.info("✅ All edges configured successfully")
         
         # =====================================
         # COMPILE GRAPH
         # =====================================
-        compiled_graph = graph.compile()
+        compiled_graph = graph.compile(checkpointer=checkpointer)
         logger.info("✅ Graph compiled successfully")
         
         logger.info("="*60)
@@ -0,0 +1,138 @@
+# chatbot/memory.py
+"""
+Server-side conversation memory.
+
+The graph is compiled with a SQLite checkpointer, so each call loads the thread's state by
+thread_id and the client no longer resends the history. The checkpointer needs the optional
+langgraph-checkpoint-sqlite package (see requirements.txt); without it the graph runs
+without one and each message is answered with no memory of earlier ones. Memory stays bounded in two ways:
+- memory_node keeps the last CHATBOT_HISTORY_TURNS turns word for word and folds older
+  ones into a running summary;
+- the checkpointer keeps only each thread's latest CHATBOT_CHECKPOINTS_PER_THREAD
+  checkpoints.
+A thread's stored state and the prompt built from it therefore stop growing with the
+length of the conversation.
+"""
+import logging
+import sqlite3
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:
+    SqliteSaver = None
+
+TURN_MAX_CHARS = 1000  # per message kept in the history
+SUMMARY_MAX_WORDS = 150
+
+
+if SqliteSaver is not None:
+    class BoundedSqliteSaver(SqliteSaver):
+        """SqliteSaver that prunes a thread to its latest `keep` checkpoints whenever it writes one."""
+
+        def __init__(self, conn, keep=3, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.keep = keep
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            with self.cursor() as cur:
+                # Checkpoint ids sort by creation time; pending writes go with their checkpoint
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                        "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                        "ORDER BY checkpoint_id DESC LIMIT ?)",
+                        (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.keep),
+                    )
+            return next_config
+
+        def delete_thread(self, thread_id):
+            """Forget everything stored for a thread."""
+            with self.cursor() as cur:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (str(thread_id),))
+
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def get_checkpointer():
+    """
+    The process-wide checkpointer, on its own SQLite file (CHATBOT_CHECKPOINT_DB), or None
+    when langgraph-checkpoint-sqlite isn't installed.
+    """
+    global _checkpointer
+    if SqliteSaver is None:
+        logger.warning("langgraph-checkpoint-sqlite is not installed: the chatbot runs without conversation memory")
+        return None
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            conn = sqlite3.connect(settings.CHATBOT_CHECKPOINT_DB, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")  # readers don't wait on a writing thread
+            _checkpointer = BoundedSqliteSaver(conn, keep=settings.CHATBOT_CHECKPOINTS_PER_THREAD)
+    return _checkpointer
+
+
+def conversation_context(state):
+    """The conversation so far (summary plus recent turns) as a prompt section, or "" for a new thread."""
+    parts = []
+    if state.get("conversation_summary"):
+        parts.append(f"Summary of earlier conversation: {state['conversation_summary']}")
+    for turn in (state.get("conversation_history") or [])[-settings.CHATBOT_HISTORY_TURNS:]:
+        parts.append(f"User: {turn['user']}\nAssistant: {turn['assistant']}")
+    if not parts:
+        return ""
+    return "\n[CONVERSATION_SO_FAR]\n" + "\n".join(parts) + "\n"
+
+
+def summarize_turns(summary, turns):
+    """Fold `turns` into the running summary; keeps the old summary if the LLM call fails."""
+    transcript = "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+    prompt = f"""
+Update the running summary of a conversation between a user and a medication adherence assistant.
+Keep what the assistant may need later: medications, symptoms, concerns, preferences.
+Use at most {SUMMARY_MAX_WORDS} words. Output ONLY the summary.
+
+Current summary:
+{summary or "(none)"}
+
+New turns:
+{transcript}
+"""
+    from chatbot.llm import llm  # not at import time: the LLM client is built when imported
+
+    try:
+        updated = llm.invoke(prompt).content.strip()
+    except Exception as e:
+        logger.warning(f"Could not summarize conversation, keeping the previous summary: {e}")
+        return summary
+    return " ".join(updated.split()[:SUMMARY_MAX_WORDS])
+
+
+def memory_node(state):
+    """
+    Last step of every turn: append the exchange to the history. Once the history grows past
+    CHATBOT_HISTORY_TURNS, the older half is folded into the summary in one LLM call. The
+    summarizer therefore runs once every few turns rather than on each one.
+    """
+    history = list(state.get("conversation_history") or [])
+    history.append({
+        "user": (state.get("user_input") or "")[:TURN_MAX_CHARS],
+        "assistant": (state.get("response") or "")[:TURN_MAX_CHARS],
+    })
+    summary = state.get("conversation_summary") or ""
+
+    limit = settings.CHATBOT_HISTORY_TURNS
+    if len(history) > limit:
+        keep = max(1, limit // 2)
+        summary = summarize_turns(summary, history[:-keep])
+        history = history[-keep:]
+    return {"conversation_history": history, "conversation_summary": summary}
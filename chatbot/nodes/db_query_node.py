@@ -35,23 +35,28 @@ def db_query_node(state: dict, conn):
     # =============================================
     if query_type == "last_missed_dose":
 
-        cursor.execute("""
-            SELECT 
-                dl.id,
-                m.pill_name,
-                datetime(dl.scheduled_time),
-                datetime(dl.timestamp),
-                dl.status
-            FROM medicines_doselog dl
-            JOIN medicines_medication m
-                ON dl.medication_id = m.id
-            WHERE dl.user_id = ?
-              AND dl.status = 'missed'
-            ORDER BY dl.scheduled_time DESC
-            LIMIT 1;
-        """, (user_id,))
-
-        row = cursor.fetchone()
+        # Closed months are moved to the archive (compact_dose_logs): look there if the
+        # hot table has no miss
+        row = None
+        for table in ("medicines_doselog", "medicines_doselogarchive"):
+            cursor.execute(f"""
+                SELECT 
+                    dl.id,
+                    m.pill_name,
+                    datetime(dl.scheduled_time),
+                    datetime(dl.timestamp),
+                    dl.status
+                FROM {table} dl
+                JOIN medicines_medication m
+                    ON dl.medication_id = m.id
+                WHERE dl.user_id = ?
+                  AND dl.status = 'missed'
+                ORDER BY dl.scheduled_time DESC
+                LIMIT 1;
+            """, (user_id,))
+            row = cursor.fetchone()
+            if row:
+                break
 
         if row:
             result_payload["result"] = {
@@ -199,21 +204,25 @@ def db_query_node(state: dict, conn):
     # =============================================
     elif query_type == "recent_history":
 
-        cursor.execute("""
-            SELECT 
-                m.pill_name,
-                datetime(dl.scheduled_time),
-                datetime(dl.timestamp),
-                dl.status
-            FROM medicines_doselog dl
-            JOIN medicines_medication m
-                ON dl.medication_id = m.id
-            WHERE dl.user_id = ?
-            ORDER BY dl.scheduled_time DESC
-            LIMIT 10;
-        """, (user_id,))
-
-        rows = cursor.fetchall()
+        # Topped up from the archive of closed months when the hot table has fewer than 10
+        rows = []
+        for table in ("medicines_doselog", "medicines_doselogarchive"):
+            cursor.execute(f"""
+                SELECT 
+                    m.pill_name,
+                    datetime(dl.scheduled_time),
+                    datetime(dl.timestamp),
+                    dl.status
+                FROM {table} dl
+                JOIN medicines_medication m
+                    ON dl.medication_id = m.id
+                WHERE dl.user_id = ?
+                ORDER BY dl.scheduled_time DESC
+                LIMIT ?;
+            """, (user_id, 10 - len(rows)))
+            rows += cursor.fetchall()
+            if len(rows) >= 10:
+                break
 
         result_payload["result"] = [
             {
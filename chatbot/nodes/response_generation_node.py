@@ -1,5 +1,6 @@
 from chatbot.state import State
 from chatbot.llm import llm
+from chatbot.memory import conversation_context
 
 
 # -----------------------respobnse generation node-------------------------
@@ -55,7 +56,9 @@ Output ONLY the final chat response text.
     # BUILD CONTEXT FOR LLM
     # ============================================================
 
-    user_context = ""
+    # Summary and recent turns restored by the checkpointer (bounded, see chatbot.memory)
+    conversation = conversation_context(state)
+    user_context = conversation
 
     # 1. Education content
     if education:
@@ -89,7 +92,7 @@ Output ONLY the final chat response text.
     if intent == "smalltalk":
         prompt = SYSTEM_PROMPT + f"""
 The user is making smalltalk. Respond with a friendly, short message.
-
+{conversation}
 User message:
 {state["user_input"]}
 """
@@ -6,7 +6,8 @@ class State(TypedDict, total=False):
     # ----------------------------------------------------
     user_id: int                   # Authenticated Django user
     user_input: str                # Raw user message
-    conversation_history: List[Dict[str, str]]  # NEW: Previous 5 message pairs
+    conversation_history: List[Dict[str, str]]  # Recent {"user", "assistant"} turns, restored by the checkpointer
+    conversation_summary: str      # Older turns, folded in by memory_node
 
     # ----------------------------------------------------
     # Safety Gate
@@ -25,6 +25,7 @@ def setup_django_for_chatbot():
 # chatbot/utils.py
 import threading
 import logging
+import uuid
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -36,6 +37,7 @@ class ChatbotWrapper:
     
     def __init__(self):
         self.graph = None
+        self.checkpointer = None
     
     def initialize(self):
         """Lazy initialization of the chatbot graph"""
@@ -44,41 +46,59 @@ class ChatbotWrapper:
                 if self.graph is None:
                     try:
                         from .graph_builder import build_graph
-                        self.graph = build_graph()
+                        from .memory import get_checkpointer
+                        self.checkpointer = get_checkpointer()
+                        self.graph = build_graph(checkpointer=self.checkpointer)
                         logger.info("Chatbot graph initialized")
                     except Exception as e:
                         logger.error(f"Failed to initialize chatbot: {e}")
                         raise
     
-    def process(self, user_input, user_id=None, context=None):
+    def process(self, user_input, user_id=None, context=None, remember=False):
         """
         Process user message.
         
         Args:
             user_input: str - user message
             user_id: str/int - user identifier
-            context: dict - conversation context
+            context: dict - per-request options; {"reset": True} starts a new conversation.
+                The history itself is loaded server-side from the checkpointer by thread_id.
+            remember: bool - keep the conversation in the user's stored thread. Only for a
+                user_id the caller has authenticated: anyone else gets a throwaway thread.
             
         Returns:
             dict - chatbot response
         """
         self.initialize()
         
-        # Prepare state
+        context = context or {}
+        
+        # Prepare state. conversation_history/summary are left out so the checkpointed
+        # values carry over; the per-turn fields are reset so the last turn's don't leak in.
         state = {
             "user_id": user_id,
             "user_input": user_input,
-            "context": context or {},
+            "context": context,
             "timestamp": timezone.now(),
             "intent": None,
+            "query_type": None,
             "is_emergency": False,
+            "emergency_type": None,
+            "medication_context": None,
+            "education_content": None,
+            "db_query_result": None,
+            "adherence_summary": None,
+            "behavior_signal": None,
             "response": "",
             "symptom_logs": [],
-            "conversation_history": context.get('history', []) if context else []
         }
         
-        # Generate thread ID
-        thread_id = f"user_{user_id}" if user_id else f"anon_{hash(user_input)}"
+        # Generate thread ID: one conversation per authenticated user; other calls get a
+        # throwaway thread, so a user_id from the request body can't read or reset another's
+        remember = bool(remember and user_id)
+        thread_id = f"user_{user_id}" if remember else f"anon_{uuid.uuid4().hex}"
+        if context.get("reset") and self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
         
         try:
             result = self.graph.invoke(
@@ -107,6 +127,9 @@ class ChatbotWrapper:
                 "response": "I'm experiencing technical difficulties. Please try again.",
                 "error": str(e)
             }
+        finally:
+            if not remember and self.checkpointer is not None:
+                self.checkpointer.delete_thread(thread_id)
 
 # Singleton instance
 chatbot = ChatbotWrapper()
\ No newline at end of file
@@ -14,3 +14,17 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crudapp.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (settings are configured above)
+
+if settings.DEBUG:
+    # Serve static files like runserver does, for `uvicorn crudapp.asgi:application`
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
+
+from medicines.utils.model_registry import registry  # noqa: E402
+
+if settings.ADHERENCE_MODEL_WARM:
+    # Load the adherence model now rather than on the first request that needs it
+    registry.warm()
@@ -113,6 +113,42 @@ MIDDLEWARE = [
 VAPID_PUBLIC_KEY = config("VAPID_PUBLIC_KEY", default="")
 VAPID_PRIVATE_KEY = config("VAPID_PRIVATE_KEY", default="")
 
+# Reminder push fan-out (run_medication_check)
+PUSH_WORKERS = config("PUSH_WORKERS", default=8, cast=int)
+PUSH_TIMEOUT = config("PUSH_TIMEOUT", default=10, cast=float)  # seconds, per endpoint
+PUSH_SLOW_SECONDS = config("PUSH_SLOW_SECONDS", default=2.0, cast=float)  # a push slower than this is a slow strike
+PUSH_LOW_PRIORITY_STRIKES = config("PUSH_LOW_PRIORITY_STRIKES", default=3, cast=int)  # strikes before the low-priority lane
+REMINDER_CATCH_UP_MINUTES = config("REMINDER_CATCH_UP_MINUTES", default=60, cast=int)  # how far back unsent slots are resumed
+RISK_PRE_REMINDER_MINUTES = config("RISK_PRE_REMINDER_MINUTES", default=15, cast=int)  # extra push this long before high-risk doses (0: off)
+RISK_PRE_REMINDER_THRESHOLD = config("RISK_PRE_REMINDER_THRESHOLD", default=0.7, cast=float)  # RiskScore.miss_probability that counts as high risk
+
+# DoseLog history: closed months older than this are compacted by compact_dose_logs
+DOSE_LOG_HOT_MONTHS = config("DOSE_LOG_HOT_MONTHS", default=2, cast=int)  # closed months kept in the hot table
+
+# Adherence model serving (medicines/utils/model_registry.py)
+ADHERENCE_MODEL_PATH = config("ADHERENCE_MODEL_PATH", default=str(BASE_DIR / "medicines" / "ml_model" / "adherence_model.pkl"))
+ADHERENCE_MODEL_CHECK_SECONDS = config("ADHERENCE_MODEL_CHECK_SECONDS", default=30, cast=float)  # how often to look for a new artifact
+ADHERENCE_MODEL_WARM = config("ADHERENCE_MODEL_WARM", default=True, cast=bool)  # load at worker startup
+ADHERENCE_FEATURES_MAX_AGE_HOURS = config("ADHERENCE_FEATURES_MAX_AGE_HOURS", default=24, cast=float)  # stored features older than this are recomputed before scoring
+
+# Chatbot conversation memory (chatbot/memory.py)
+CHATBOT_CHECKPOINT_DB = config("CHATBOT_CHECKPOINT_DB", default=str(BASE_DIR / "chatbot_memory.sqlite3"))
+CHATBOT_HISTORY_TURNS = config("CHATBOT_HISTORY_TURNS", default=10, cast=int)  # turns kept word for word; older ones are summarized
+CHATBOT_CHECKPOINTS_PER_THREAD = config("CHATBOT_CHECKPOINTS_PER_THREAD", default=3, cast=int)
+
+# Live dose-status stream (server-sent events, served by crudapp/asgi.py)
+DOSE_STREAM_POLL_SECONDS = config("DOSE_STREAM_POLL_SECONDS", default=0.5, cast=float)  # how often each server process checks its open streams' users for changes made by other processes (needs a shared CACHE_BACKEND)
+DOSE_STREAM_HEARTBEAT_SECONDS = config("DOSE_STREAM_HEARTBEAT_SECONDS", default=15, cast=float)  # keep-alive comment for idle connections
+
+# Cache (dashboard). Local memory by default; point at a shared backend in production, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache CACHE_LOCATION=redis://127.0.0.1:6379
+CACHES = {
+	'default': {
+		'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+		'LOCATION': config('CACHE_LOCATION', default=''),
+	}
+}
+
 ROOT_URLCONF = 'crudapp.urls'
 
 TEMPLATES = [
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crudapp.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402  (settings are configured above)
+from medicines.utils.model_registry import registry  # noqa: E402
+
+if settings.ADHERENCE_MODEL_WARM:
+    # Load the adherence model now rather than on the first request that needs it
+    registry.warm()
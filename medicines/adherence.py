@@ -0,0 +1,195 @@
+# medicines/adherence.py
+"""
+Maintenance of the adherence rollups: DailyAdherence over the hot DoseLog table, and
+MonthlyAdherence over closed months whose raw rows were moved to DoseLogArchive.
+"""
+from collections import Counter, defaultdict
+from datetime import date, datetime
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from medicines.models import DailyAdherence, DoseLog, DoseLogArchive, MonthlyAdherence
+
+
+def local_day(dt):
+    """The local calendar day an aware datetime falls on."""
+    return timezone.localtime(dt).date()
+
+
+def aggregate_daily(queryset):
+    """Group DoseLogs by user and local day into expected/taken/missed counts."""
+    return (
+        queryset
+        .annotate(day=TruncDate('scheduled_time'))
+        .values('user_id', 'day')
+        .annotate(
+            expected=Count('id'),
+            taken=Count('id', filter=Q(status='taken')),
+            missed=Count('id', filter=Q(status='missed')),
+        )
+        .order_by()
+    )
+
+
+def upsert_daily(rows):
+    """Insert or overwrite DailyAdherence rows in one statement."""
+    DailyAdherence.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=['expected', 'taken', 'missed'],
+        batch_size=1000,
+    )
+
+
+def refresh_daily_adherence(user_days):
+    """
+    Recompute the rollup for the given (user_id, date) pairs only: one grouped query over
+    the DoseLogs of those days and one upsert, however many users are involved.
+    """
+    by_user = defaultdict(set)
+    for user_id, day in user_days:
+        by_user[user_id].add(day)
+    if not by_user:
+        return
+
+    days = {day for user_days_ in by_user.values() for day in user_days_}
+    start = timezone.make_aware(datetime.combine(min(days), datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(max(days), datetime.max.time()))
+
+    counts = {
+        (row['user_id'], row['day']): row
+        for row in aggregate_daily(DoseLog.objects.filter(
+            user_id__in=list(by_user),
+            scheduled_time__range=(start, end),
+        ))
+    }
+
+    rows = []
+    for user_id, user_days_ in by_user.items():
+        for day in user_days_:
+            row = counts.get((user_id, day), {})
+            rows.append(DailyAdherence(
+                user_id=user_id,
+                date=day,
+                expected=row.get('expected', 0),
+                taken=row.get('taken', 0),
+                missed=row.get('missed', 0),
+            ))
+    upsert_daily(rows)
+
+
+def rebuild_daily_adherence(user_ids=None):
+    """Rebuild the whole rollup from DoseLog history (backfill); returns the number of rows written."""
+    logs = DoseLog.objects.all()
+    rollup = DailyAdherence.objects.all()
+    if user_ids is not None:
+        logs = logs.filter(user_id__in=user_ids)
+        rollup = rollup.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        rollup.delete()
+        rows = [
+            DailyAdherence(
+                user_id=row['user_id'],
+                date=row['day'],
+                expected=row['expected'],
+                taken=row['taken'],
+                missed=row['missed'],
+            )
+            for row in aggregate_daily(logs).iterator()
+        ]
+        upsert_daily(rows)
+    return len(rows)
+
+
+def archive_cutoff(hot_months, today=None):
+    """First local day kept in the hot DoseLog table: the start of the month `hot_months` before this one."""
+    today = today or timezone.localdate()
+    months = today.year * 12 + (today.month - 1) - hot_months
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def compact_dose_logs(cutoff, chunk_size=5000):
+    """
+    Move DoseLogs scheduled before `cutoff` (a local first-of-month) to DoseLogArchive. Their
+    counts are added to MonthlyAdherence and taken out of the DailyAdherence rows of their
+    days (rows left empty are dropped), so totals stay the same. Runs in chunks, one transaction each, so it can be stopped and
+    rerun; rows logged late into an already compacted month are added on the next run.
+    Returns the number of rows archived.
+    """
+    cutoff_dt = timezone.make_aware(datetime.combine(cutoff, datetime.min.time()))
+    archived = 0
+    while True:
+        with transaction.atomic():
+            logs = list(DoseLog.objects.filter(scheduled_time__lt=cutoff_dt).order_by('id')[:chunk_size])
+            if not logs:
+                break
+
+            counts = defaultdict(Counter)
+            for log in logs:
+                counts[(log.user_id, log.medication_id, local_day(log.scheduled_time).replace(day=1))].update(
+                    ['expected', log.status]
+                )
+            user_ids = {user_id for user_id, medication_id, month in counts}
+            existing = {
+                (row.user_id, row.medication_id, row.month): row
+                for row in MonthlyAdherence.objects.filter(
+                    user_id__in=user_ids, month__in={month for user_id, medication_id, month in counts}
+                )
+            }
+            rows = []
+            for key, counter in counts.items():
+                row = existing.get(key) or MonthlyAdherence(user_id=key[0], medication_id=key[1], month=key[2])
+                row.expected += counter['expected']
+                row.taken += counter['taken']
+                row.missed += counter['missed']
+                rows.append(row)
+            MonthlyAdherence.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'medication', 'month'],
+                update_fields=['expected', 'taken', 'missed'],
+            )
+
+            DoseLogArchive.objects.bulk_create([
+                DoseLogArchive(
+                    id=log.id,
+                    medication_id=log.medication_id,
+                    user_id=log.user_id,
+                    timestamp=log.timestamp,
+                    scheduled_time=log.scheduled_time,
+                    status=log.status,
+                )
+                for log in logs
+            ])
+            DoseLog.objects.filter(id__in=[log.id for log in logs]).delete()
+            # Recount just the days these logs were on: a day split across chunks keeps
+            # the logs still waiting for the next one
+            user_days = {(log.user_id, local_day(log.scheduled_time)) for log in logs}
+            refresh_daily_adherence(user_days)
+            DailyAdherence.objects.filter(
+                user_id__in=user_ids, date__in={day for user_id, day in user_days}, expected=0,
+            ).delete()
+        archived += len(logs)
+    return archived
+
+
+def adherence_totals(user):
+    """(expected, taken) over the user's whole history: archived months plus the hot rollup."""
+    totals = [
+        model.objects.filter(user=user).aggregate(expected=Sum('expected'), taken=Sum('taken'))
+        for model in (MonthlyAdherence, DailyAdherence)
+    ]
+    return sum(t['expected'] or 0 for t in totals), sum(t['taken'] or 0 for t in totals)
+
+
+def recent_dose_history(user, limit=10):
+    """The user's latest doses, newest first, topped up from the archive if the hot table runs short."""
+    recent = list(DoseLog.objects.filter(user=user).order_by('-scheduled_time')[:limit])
+    if len(recent) < limit:
+        recent += DoseLogArchive.objects.filter(user=user).order_by('-scheduled_time')[:limit - len(recent)]
+    return recent
@@ -0,0 +1,97 @@
+# medicines/dashboard_cache.py
+"""
+Per-user cache of the computed dashboard (dose_data, adherence, streak, weekly series).
+
+Entries are keyed by user, local date and a per-user version number. Any change to the
+user's Medication or DoseLog rows bumps the version (see invalidate_dashboard), so stale
+entries are never read again and simply age out of the cache backend.
+"""
+import time
+
+from django.core.cache import cache
+
+HITS_KEY = "dashboard:hits"
+MISSES_KEY = "dashboard:misses"
+
+
+def _version_key(user_id):
+    return f"dashboard:version:{user_id}"
+
+
+def _new_version():
+    # Time based, so a version key lost to eviction can never come back as an old value
+    return int(time.time() * 1000)
+
+
+def current_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = _new_version()
+        cache.add(_version_key(user_id), version, timeout=None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def invalidate_dashboard(user_id):
+    """Drop every cached dashboard of this user by moving to a new version."""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), _new_version(), timeout=None)
+
+
+def dashboard_etag(user_id, day):
+    """
+    Version token for the user's dose data on `day`: it changes whenever the user's
+    Medication or DoseLog rows do, and costs a single cache lookup.
+    """
+    return f"{user_id}-{day.isoformat()}-{current_version(user_id)}"
+
+
+def dashboard_etags(user_ids, day):
+    """dashboard_etag for many users at once: {user_id: token}, one cache round trip."""
+    versions = cache.get_many([_version_key(user_id) for user_id in user_ids])
+    return {
+        user_id: f"{user_id}-{day.isoformat()}-{versions.get(_version_key(user_id)) or current_version(user_id)}"
+        for user_id in user_ids
+    }
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_dashboard(user_id, day, build):
+    """
+    Return the cached dashboard for (user, day), calling `build()` on a miss.
+    `build` returns (data, timeout_seconds); the timeout should end when the data would
+    change on its own (e.g. the next scheduled dose becomes due).
+    """
+    version = current_version(user_id)
+    key = f"dashboard:{user_id}:{day.isoformat()}:{version}"
+    data = cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        return data
+
+    _count(MISSES_KEY)
+    data, timeout = build()
+    # Something changed while building (possibly the build itself marking doses missed):
+    # don't store a result that may already be out of date
+    if current_version(user_id) == version:
+        cache.set(key, data, timeout=max(1, int(timeout)))
+    return data
+
+
+def cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 3) if lookups else 0,
+    }
@@ -0,0 +1,48 @@
+# medicines/dose_events.py
+"""
+The one call to make after DoseLog rows are created or change status, so that
+everything derived from them stays in step.
+"""
+from collections import defaultdict
+
+from django.utils import timezone
+
+from medicines.adherence import local_day, refresh_daily_adherence
+from medicines.dashboard_cache import dashboard_etag, invalidate_dashboard
+from medicines.dose_stream import broker
+from medicines.utils.feature_store import refresh_pair_features
+
+
+def dose_logs_changed(user_days, dose_logs=(), pairs=()):
+    """
+    `user_days` is an iterable of (user_id, local date) pairs whose DoseLogs changed.
+    `dose_logs` optionally lists the changed rows, so live streams can show their new status.
+    `pairs` lists the (user_id, medication_id) pairs whose DoseLogs changed, when
+    `dose_logs` doesn't already cover them, so their stored features are recomputed.
+    """
+    user_days = set(user_days)
+    if not user_days:
+        return
+    refresh_daily_adherence(user_days)
+    refresh_pair_features(set(pairs) | {(log.user_id, log.medication_id) for log in dose_logs})
+
+    days_by_user = defaultdict(set)
+    for user_id, day in user_days:
+        days_by_user[user_id].add(day)
+    doses_by_user = defaultdict(list)
+    for log in dose_logs:
+        doses_by_user[log.user_id].append({'dose_log_id': log.id, 'status': log.status})
+
+    today = timezone.localdate()
+    for user_id, days in days_by_user.items():
+        invalidate_dashboard(user_id)
+        broker.publish(user_id, {
+            'version': dashboard_etag(user_id, today),
+            'dates': sorted(day.isoformat() for day in days),
+            'doses': doses_by_user[user_id],
+        })
+
+
+def dose_log_changed(dose_log):
+    """Convenience wrapper for a single DoseLog."""
+    dose_logs_changed([(dose_log.user_id, local_day(dose_log.scheduled_time))], [dose_log])
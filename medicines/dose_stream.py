@@ -0,0 +1,107 @@
+# medicines/dose_stream.py
+"""
+In-process publish/subscribe of dose-status changes, feeding the dashboard's
+server-sent event stream (views.dose_status_stream).
+
+Publishers (dose_events.dose_logs_changed) may run in any thread; each subscriber is an
+asyncio queue read by one open stream. Changes made by other processes (the reminder
+worker, other server workers) never reach this broker. They show up as a new per-user
+dashboard version instead, which one poller per event loop reads for every user with an
+open stream (a single cache.get_many every DOSE_STREAM_POLL_SECONDS, whatever the number
+of tabs) and publishes here. That only works when CACHE_BACKEND is shared between the
+processes: with the default per-process LocMemCache a stream sees its own process's
+changes only.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from medicines.dashboard_cache import dashboard_etags
+
+
+class DoseStatusBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._pollers = {}  # loop -> its version poller task
+
+    @contextmanager
+    def subscribe(self, user_id):
+        """Yield an asyncio.Queue receiving this user's events; call from a running event loop."""
+        loop = asyncio.get_running_loop()
+        entry = (loop, asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers[user_id].add(entry)
+            if loop not in self._pollers:
+                self._pollers[loop] = loop.create_task(self._poll_versions(loop))
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[user_id]
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event):
+        """Hand `event` to every open stream of this user; returns how many there were."""
+        with self._lock:
+            entries = list(self._subscribers.get(user_id, ()))
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                pass  # that stream's event loop has already closed
+        return len(entries)
+
+    async def _poll_versions(self, loop):
+        """
+        Publish a version event whenever the dashboard version of a user with an open stream
+        on `loop` changes. The first sighting of a user is published too; streams drop
+        events carrying the version they already have. Ends with the loop's last stream.
+        """
+        seen = {}
+        try:
+            while True:
+                await asyncio.sleep(settings.DOSE_STREAM_POLL_SECONDS)
+                with self._lock:
+                    user_ids = [
+                        user_id for user_id, entries in self._subscribers.items()
+                        if any(entry_loop is loop for entry_loop, queue in entries)
+                    ]
+                    if not user_ids:
+                        del self._pollers[loop]
+                        return
+                # Cache I/O only: off the thread-sensitive executor that sync views use
+                versions = await sync_to_async(dashboard_etags, thread_sensitive=False)(user_ids, timezone.localdate())
+                for user_id, version in versions.items():
+                    if seen.get(user_id) != version:
+                        self.publish(user_id, {'version': version, 'dates': [], 'doses': []})
+                seen = versions
+        except asyncio.CancelledError:
+            with self._lock:
+                if self._pollers.get(loop) is asyncio.current_task():
+                    del self._pollers[loop]
+            raise
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # a stalled tab; the next event it reads carries the latest version anyway
+
+
+broker = DoseStatusBroker()
+
+
+def sse_event(name, data):
+    """Format one server-sent event."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,67 @@
+import base64
+import json
+import os
+import time
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.core.management.base import BaseCommand
+from py_vapid import Vapid
+from pywebpush import WebPusher
+from medicines.notifications import PushClient
+
+
+def b64url(raw):
+    return base64.urlsafe_b64encode(raw).strip(b"=").decode()
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark the per-notification CPU cost of web push (no network traffic)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        # Throwaway VAPID key and browser subscription, so the benchmark needs no real endpoint
+        vapid = Vapid()
+        vapid.generate_keys()
+        private_key = b64url(vapid.private_key.private_numbers().private_value.to_bytes(32, 'big'))
+
+        receiver = ec.generate_private_key(ec.SECP256R1())
+        subscription_info = {
+            "endpoint": "https://push.example.com/send/benchmark",
+            "keys": {
+                "p256dh": b64url(receiver.public_key().public_bytes(
+                    serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+                )),
+                "auth": b64url(os.urandom(16)),
+            },
+        }
+        data = json.dumps({"title": " Medicine Reminder", "body": "Time to take Benchmark (10 mg)"})
+
+        def per_call():
+            # What every reminder used to do inside webpush(): parse the key, sign a fresh JWT, encrypt
+            vv = Vapid.from_string(private_key=private_key)
+            vv.sign({
+                "sub": "mailto:medication-tracker@example.com",
+                "aud": "https://push.example.com",
+                "exp": int(time.time()) + 12 * 60 * 60,
+            })
+            WebPusher(subscription_info).encode(data.encode())
+
+        client = PushClient(private_key)
+        origin = "https://push.example.com"
+
+        def cached_client():
+            # PushClient.send without the HTTP request
+            dict(client.vapid_headers(origin))
+            WebPusher(subscription_info, requests_session=client.session(origin)).encode(data.encode())
+
+        for label, fn in (("webpush() per call", per_call), ("PushClient", cached_client)):
+            fn()  # warm up
+            started = time.process_time()
+            for _ in range(iterations):
+                fn()
+            cpu_ms = (time.process_time() - started) * 1000 / iterations
+            self.stdout.write(f" {label}: {cpu_ms:.3f} ms CPU per notification ({iterations} iterations)")
@@ -0,0 +1,74 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from medicines.models import DoseLog, Medication
+from medicines.utils.feature_extractor import FEATURES, archived_counts, extract_features
+from medicines.utils.feature_store import refresh_adherence_features, stored_features
+from medicines.utils.model_registry import registry
+from medicines.utils.training import chunk_examples, iter_dose_chunks
+
+
+class Command(BaseCommand):
+    help = 'Check that training, serving and the feature store build identical feature vectors (fails on any difference)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=100, help='Random user-medication pairs to check')
+        parser.add_argument('--doses', type=int, default=5, help='Latest logged doses checked per pair')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        meds = {
+            med.id: med
+            for med in (
+                Medication.objects
+                .filter(Exists(DoseLog.objects.filter(medication=OuterRef('pk'))), user__isnull=False)
+                .order_by('?')[:options['pairs']]
+            )
+        }
+        if not meds:
+            self.stdout.write(self.style.WARNING(' No medications with dose logs to check'))
+            return
+        user_ids = {med.user_id for med in meds.values()}
+        mismatches = []
+
+        # Training: each log's vector, built from the pair's earlier logs. Serving: extract_features
+        # just before that dose, when the dose is the next one.
+        times_per_day = {med_id: med.times_per_day for med_id, med in meds.items()}
+        pairs = {(med.user_id, med_id) for med_id, med in meds.items()}
+        archived = archived_counts(list(meds))
+        doses_checked = 0
+        for chunk in iter_dose_chunks(now, user_ids=user_ids):
+            features, _ = chunk_examples(chunk, times_per_day, archived)
+            sampled = [pair in pairs for pair in zip(chunk['user_id'], chunk['medication_id'])]
+            for medication_id, doses in chunk.assign(row=np.arange(len(chunk)))[sampled].groupby('medication_id'):
+                med = meds[medication_id]
+                for dose in doses.tail(options['doses']).itertuples():
+                    trained = features.iloc[dose.row].tolist()
+                    served = FEATURES.vector(extract_features(med.user_id, med, now=dose.scheduled_time.to_pydatetime()))
+                    doses_checked += 1
+                    if not np.allclose(trained, served):
+                        mismatches.append(f"train/serve medication {medication_id} dose {dose.scheduled_time}: {trained} != {served}")
+
+        # Feature store: the stored row's vector against extract_features at the same moment
+        refresh_adherence_features(user_ids, now)
+        stored = stored_features(Medication.objects.filter(id__in=meds.keys()), now)
+        for medication_id, med in meds.items():
+            served = FEATURES.vector(extract_features(med.user_id, med, now=now))
+            kept = stored.loc[medication_id, list(FEATURES.columns)].tolist() if medication_id in stored.index else None
+            if kept is None or not np.allclose(kept, served):
+                mismatches.append(f"store/serve medication {medication_id}: {kept} != {served}")
+
+        # The served model takes the schema's columns
+        try:
+            FEATURES.for_model(stored, registry.current().model)
+        except (OSError, ValueError) as e:
+            mismatches.append(f"model: {e}")
+
+        for mismatch in mismatches[:20]:
+            self.stdout.write(self.style.ERROR(f' {mismatch}'))
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} feature mismatches')
+        self.stdout.write(self.style.SUCCESS(
+            f' Feature schema v{FEATURES.version}: {doses_checked} train/serve doses and {len(meds)} stored rows identical'
+        ))
@@ -0,0 +1,21 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from medicines.adherence import archive_cutoff, compact_dose_logs
+
+class Command(BaseCommand):
+    help = 'Archive DoseLogs of closed months into monthly summaries, keeping the hot table bounded (run e.g. daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hot-months', type=int, default=settings.DOSE_LOG_HOT_MONTHS,
+                            help='Closed months kept in the hot DoseLog table besides the current one')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows archived per transaction')
+
+    def handle(self, *args, **options):
+        # The dashboard's 30-day window must stay in the hot table
+        cutoff = archive_cutoff(max(1, options['hot_months']))
+        started = time.perf_counter()
+        count = compact_dose_logs(cutoff, options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f' Archived {count} dose logs scheduled before {cutoff} in {elapsed:.1f} s'))
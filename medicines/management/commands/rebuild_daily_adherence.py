@@ -0,0 +1,16 @@
+import time
+from django.core.management.base import BaseCommand
+from medicines.adherence import rebuild_daily_adherence
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailyAdherence rollup from DoseLog history (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild this user id (can be repeated)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_daily_adherence(options['user_ids'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f' Rebuilt {count} daily adherence rows in {elapsed:.1f} s'))
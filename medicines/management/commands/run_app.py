@@ -1,38 +1,62 @@
 import threading
 import os
+import subprocess
+import sys
 import time
-from django.core.management import call_command
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
 class Command(BaseCommand):
     help = 'Start the complete MediMimes application (server + medication monitoring)'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--reminder-workers', type=int, default=1,
+                            help='Number of reminder worker processes; users are sharded across them')
+        parser.add_argument('--web-workers', type=int, default=None,
+                            help='Number of uvicorn worker processes (default: up to 4 with a shared '
+                                 'CACHE_BACKEND, 1 with the per-process LocMemCache)')
+
     def handle(self, *args, **options):
+        shards = max(1, options['reminder_workers'])
+        # Server processes only see each other's changes (dashboard cache, live streams)
+        # through a shared cache
+        shared_cache = 'locmem' not in settings.CACHES['default']['BACKEND'].lower()
+        web_workers = options['web_workers'] or (min(4, os.cpu_count() or 1) if shared_cache else 1)
+        if web_workers > 1 and not shared_cache:
+            self.stdout.write(self.style.WARNING(
+                ' Several web workers with LocMemCache: dashboards and live streams will miss other workers\' changes'
+            ))
+
         def run_server():
-            """Run Django development server"""
-            os.system('python manage.py runserver 127.0.0.1:8000')
+            """Run the ASGI server (the live dose-status stream needs ASGI, not runserver's WSGI)"""
+            os.system(f'{sys.executable} -m uvicorn crudapp.asgi:application --host 127.0.0.1 --port 8000 --workers {web_workers}')
         
-        def run_medication_check():
-            """Run medication check in a loop"""
-            while True:
-                call_command('run_medication_check')
-                time.sleep(60)  # Check every minute
+        def run_medication_check(shard):
+            """Run one reminder worker process (it loops every minute on its own)"""
+            cmd = [sys.executable, 'manage.py', 'run_medication_check']
+            if shards > 1:
+                cmd += ['--shard', f'{shard}/{shards}']
+            subprocess.run(cmd)
         
-        # Start both threads
+        # Start the server and one thread per reminder worker process
         server_thread = threading.Thread(target=run_server, daemon=True)
-        check_thread = threading.Thread(target=run_medication_check, daemon=True)
+        check_threads = [
+            threading.Thread(target=run_medication_check, args=(shard,), daemon=True)
+            for shard in range(shards)
+        ]
         
         server_thread.start()
-        check_thread.start()
+        for check_thread in check_threads:
+            check_thread.start()
         
         self.stdout.write(
             self.style.SUCCESS(' MediMimes application started successfully!')
         )
         self.stdout.write(
-            self.style.SUCCESS(' Server running on: http://127.0.0.1:8000/')
+            self.style.SUCCESS(f' Server running on: http://127.0.0.1:8000/ ({web_workers} worker(s))')
         )
         self.stdout.write(
-            self.style.SUCCESS(' Medication monitoring: ACTIVE')
+            self.style.SUCCESS(f' Medication monitoring: ACTIVE ({shards} worker(s))')
         )
         
         # Keep main thread alive
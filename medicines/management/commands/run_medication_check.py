@@ -1,97 +1,133 @@
-import json
-from django.core.management.base import BaseCommand
-import datetime
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-import time
-from pywebpush import webpush, WebPushException
-from medicines.models import Medication, PushSubscription, DoseLog
 from django.conf import settings
+import time
+from medicines.reminders import (
+    catch_up_slots, parse_shard, pending_slots, percentile, process_slots, sleep_until_next_minute
+)
 
 class Command(BaseCommand):
     help = 'Run medication notifications in a single process'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PUSH_WORKERS,
+                            help='Number of concurrent push senders')
+        parser.add_argument('--push-timeout', type=float, default=settings.PUSH_TIMEOUT,
+                            help='Timeout in seconds for each push endpoint')
+        parser.add_argument('--catch-up', action='store_true',
+                            help='On startup, also send reminders for minutes missed since the last claimed slot '
+                                 '(up to REMINDER_CATCH_UP_MINUTES)')
+        parser.add_argument('--shard', default=None,
+                            help='Only handle users with user_id %% M == N, given as N/M (run one process per shard)')
+
     def handle(self, *args, **options):
-        self.stdout.write(' Starting medication notification service...')
-        
+        try:
+            shard = parse_shard(options['shard']) if options['shard'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        worker = f"{shard[0]}/{shard[1]}" if shard else "0/1"
+
+        self.stdout.write(f' Starting medication notification service (shard {worker})...')
+
+        catch_up = options['catch_up']
+        # Throughput counters for this worker process
+        counters = {'ticks': 0, 'sent': 0, 'failed': 0, 'busy_seconds': 0.0, 'skipped_minutes': 0}
+        last_slot = None
+
         while True:
             try:
                 # Use timezone-aware datetime
                 now = timezone.localtime(timezone.now())
                 current_time = now.strftime("%H:%M")
-                
+
                 self.stdout.write(f"Current local time: {now}")
                 self.stdout.write(f" Checking medications at {current_time}...")
-                
-                meds = Medication.objects.all()
+
+                tick_started = time.perf_counter()
+
+                # Missed minutes (after downtime or a slow tick) are processed together with this one
+                if catch_up:
+                    slots = catch_up_slots(now, shard=shard)
+                    catch_up = False
+                else:
+                    slots = pending_slots(last_slot, now)
+                if not slots:
+                    # Woke up just before the boundary; this minute was already handled
+                    sleep_until_next_minute()
+                    continue
+                if len(slots) > 1:
+                    counters['skipped_minutes'] += len(slots) - 1
+                    self.stdout.write(f" CATCH-UP: processing {len(slots)} minutes since {slots[0].strftime('%H:%M')}")
+
+                # How far behind wall-clock the loop is running
+                lag_seconds = (now - slots[0]).total_seconds()
+
+                # Claim, materialize and dispatch every due reminder in one batched pass
+                results = process_slots(slots, now, options['workers'], options['push_timeout'], shard)
+                last_slot = slots[-1]
+
                 notified_count = 0
-                
-                for med in meds:
-                    if med.times and current_time in med.times:
-                        self.stdout.write(f" MATCH: {med.pill_name} at {current_time} for {med.user.username}")
-                        
-                        # Create scheduled datetime for today
-                        scheduled_datetime = timezone.now().replace(
-                            hour=int(current_time.split(':')[0]),
-                            minute=int(current_time.split(':')[1]),
-                            second=0,
-                            microsecond=0
+                sent_doses = 0
+                due_doses = 0
+                pre_reminders = 0
+                for result in results:
+                    job = result['job']
+                    pill_names = ", ".join(dose['med'].pill_name for dose in job['doses'])
+                    if job['kind'] == 'pre_reminder':
+                        # Extra push ahead of a high-risk dose; not counted as a due dose
+                        pre_reminders += result['sent']
+                        self.stdout.write(
+                            f" HIGH RISK: {pill_names} at {job['scheduled_time'].strftime('%H:%M')} for {job['user'].username}, "
+                            f"pre-reminder {'sent' if result['sent'] else 'not sent'}"
                         )
-                        
-                        # Check if DoseLog already exists
-                        dose_log, created = DoseLog.objects.get_or_create(
-                            medication=med,
-                            user=med.user,
-                            scheduled_time=scheduled_datetime,
-                            defaults={'status': 'pending'}
-                        )
-                        
-                        # Get all subscriptions for this user
-                        subs = PushSubscription.objects.filter(user=med.user)
-                        
-                        # Send notification to all subscriptions
-                        notification_sent = False
-                        for sub in subs:
-                            if not sub.p256dh or not sub.auth:
-                                continue
-                                
-                            try:
-                                # SIMPLE NOTIFICATION - No action buttons
-                                webpush(
-                                    subscription_info={
-                                        "endpoint": sub.endpoint,
-                                        "keys": {
-                                            "p256dh": sub.p256dh,
-                                            "auth": sub.auth
-                                        }
-                                    },
-                                    data=json.dumps({
-                                        "title": " Medicine Reminder",
-                                        "body": f"Time to take {med.pill_name} ({med.dosage} mg)",
-                                        "data": {
-                                            "url": "/dashboard/"  # Always redirect to dashboard
-                                        }
-                                    }),
-                                    vapid_private_key=settings.VAPID_PRIVATE_KEY,
-                                    vapid_claims={"sub": "mailto:medication-tracker@example.com"}
-                                )
-                                notified_count += 1
-                                notification_sent = True
-                                self.stdout.write(f" Sent notification for {med.pill_name}")
-                                break
-                                
-                            except WebPushException as e:
-                                self.stdout.write(f" Error: {e}")
-                                continue
-                        
-                        if not notification_sent:
-                            self.stdout.write(f" Could not send notification for {med.pill_name}")
-                
+                        continue
+                    due_doses += len(job['doses'])
+                    self.stdout.write(
+                        f" MATCH: {pill_names} at {job['scheduled_time'].strftime('%H:%M')} for {job['user'].username}"
+                    )
+                    if result['sent']:
+                        notified_count += 1
+                        sent_doses += len(job['doses'])
+                        self.stdout.write(f" Sent notification for {pill_names}")
+                    else:
+                        if result['error']:
+                            self.stdout.write(f" Error: {result['error']}")
+                        self.stdout.write(f" Could not send notification for {pill_names}")
+
                 self.stdout.write(f" TOTAL: Sent {notified_count} notifications at {current_time}")
-                time.sleep(60)
-                
+                if pre_reminders:
+                    self.stdout.write(f" PRE-REMINDERS: Sent {pre_reminders} for high-risk doses")
+
+                pruned = sum(
+                    1 for r in results for a in r['attempts'] if a['status_code'] in (404, 410)
+                )
+                if pruned:
+                    self.stdout.write(f" PRUNED: {pruned} expired push subscription(s)")
+
+                latencies = [r['latency'] * 1000 for r in results]
+                tick_seconds = time.perf_counter() - tick_started
+                self.stdout.write(
+                    f" TICK: {due_doses} due medications in {len(results)} pushes processed in {tick_seconds * 1000:.1f} ms "
+                    f"(dispatch p50 {percentile(latencies, 50):.1f} ms, p99 {percentile(latencies, 99):.1f} ms)"
+                )
+
+                counters['ticks'] += 1
+                counters['sent'] += sent_doses
+                counters['failed'] += due_doses - sent_doses
+                counters['busy_seconds'] += tick_seconds
+                handled = counters['sent'] + counters['failed']
+                rate = handled / counters['busy_seconds'] if counters['busy_seconds'] else 0
+                self.stdout.write(
+                    f" WORKER {worker}: {counters['ticks']} ticks, {counters['sent']} sent, "
+                    f"{counters['failed']} failed, {rate:.1f} reminders/s, "
+                    f"{counters['skipped_minutes']} skipped minutes recovered, lag {lag_seconds:.1f} s"
+                )
+                sleep_until_next_minute()
+
             except KeyboardInterrupt:
                 self.stdout.write(" Stopping service...")
                 break
             except Exception as e:
                 self.stdout.write(f" Error: {e}")
-                time.sleep(60)
\ No newline at end of file
+                # The failed minutes stay pending and are retried on the next boundary
+                sleep_until_next_minute()
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from medicines.utils.risk_scoring import feature_matrix, predict_miss_probability, save_risk_scores
+
+class Command(BaseCommand):
+    help = 'Score the miss-dose risk of every user-medication pair into RiskScore (run e.g. nightly)'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        started = time.perf_counter()
+        features = feature_matrix(now)
+        built = time.perf_counter()
+        if features.empty:
+            self.stdout.write(self.style.WARNING(' No medications to score'))
+            return
+        probabilities = predict_miss_probability(features)
+        predicted = time.perf_counter()
+        save_risk_scores(features, probabilities, now)
+        saved = time.perf_counter()
+
+        self.stdout.write(self.style.SUCCESS(
+            f' Scored {len(features)} user-medication pairs in {saved - started:.1f} s '
+            f'(features {built - started:.2f} s, predict {predicted - built:.2f} s, save {saved - predicted:.2f} s)'
+        ))
+        self.stdout.write(f' High risk (p >= 0.5): {int((probabilities >= 0.5).sum())}')
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from medicines.utils.feature_extractor import FEATURES
+from medicines.utils.training import evaluate_model, save_artifact, train_model
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = 'Train the adherence model from DoseLog history, streamed in chunks, into a versioned artifact with metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Only use logs scheduled before this ISO datetime (default: now), for reproducible runs')
+        parser.add_argument('--holdout-days', type=int, default=14,
+                            help='Hold out the last N days before --as-of for the metrics')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Logs read and learned per step')
+        parser.add_argument('--epochs', type=int, default=1, help='Streaming passes over the training logs')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--alpha', type=float, default=1e-4, help='SGDClassifier regularization strength')
+        parser.add_argument('--output-dir', default=os.path.dirname(settings.ADHERENCE_MODEL_PATH),
+                            help='Where the versioned artifact (adherence_model-<version>.pkl and .json) is written')
+        parser.add_argument('--publish', action='store_true',
+                            help='Also replace ADHERENCE_MODEL_PATH, which serving processes pick up on their next check')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        as_of = now
+        if options['as_of']:
+            as_of = parse_datetime(options['as_of'])
+            if as_of is None:
+                raise CommandError(f"Invalid --as-of: {options['as_of']}")
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+        holdout_from = as_of - timedelta(days=options['holdout_days'])
+        chunk_size = options['chunk_size']
+
+        started = time.perf_counter()
+        try:
+            model, training, (holdout_features, holdout_labels) = train_model(
+                as_of, holdout_from, chunk_size=chunk_size,
+                epochs=options['epochs'], seed=options['seed'], alpha=options['alpha'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        trained = time.perf_counter()
+        holdout = evaluate_model(model, holdout_features, holdout_labels)
+        evaluated = time.perf_counter()
+
+        version = now.strftime('%Y%m%d%H%M%S')
+        metadata = {
+            'version': version,
+            'trained_at': now.isoformat(),
+            'as_of': as_of.isoformat(),
+            'holdout_from': holdout_from.isoformat(),
+            'model': 'SGDClassifier',
+            'params': {'loss': 'log_loss', 'alpha': options['alpha'], 'epochs': options['epochs'],
+                       'seed': options['seed'], 'chunk_size': chunk_size},
+            'features': list(FEATURES.columns),
+            'feature_schema_version': FEATURES.version,
+            'metrics': {'train': training, 'holdout': holdout},
+            'training_seconds': round(trained - started, 2),
+            'evaluation_seconds': round(evaluated - trained, 2),
+            'peak_memory_mb': peak_memory_mb(),
+        }
+        path = os.path.join(options['output_dir'], f'adherence_model-{version}.pkl')
+        save_artifact(model, metadata, path)
+        if options['publish']:
+            save_artifact(model, metadata, settings.ADHERENCE_MODEL_PATH)
+
+        peak = metadata['peak_memory_mb']
+        self.stdout.write(self.style.SUCCESS(
+            f" Trained adherence model {version} on {training['examples']} logs in {trained - started:.1f} s "
+            f"(evaluation {evaluated - trained:.1f} s, peak memory {f'{peak:.0f} MB' if peak else 'n/a'})"
+        ))
+        if holdout['examples']:
+            auc = holdout['roc_auc']
+            self.stdout.write(
+                f" Holdout ({holdout['examples']} logs): log loss {holdout['log_loss']:.4f}, "
+                f"accuracy {holdout['accuracy']:.3f}, ROC AUC {f'{auc:.3f}' if auc is not None else 'n/a'}"
+            )
+        else:
+            self.stdout.write(self.style.WARNING(' No logs in the holdout window, no metrics'))
+        self.stdout.write(f" Wrote {path}" + (f" and {settings.ADHERENCE_MODEL_PATH}" if options['publish'] else ''))
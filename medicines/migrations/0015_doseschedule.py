@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_schedule(apps, schema_editor):
+    Medication = apps.get_model('medicines', 'Medication')
+    DoseSchedule = apps.get_model('medicines', 'DoseSchedule')
+
+    rows = []
+    for med in Medication.objects.only('id', 'times').iterator():
+        times_list = med.times if isinstance(med.times, list) else []
+        minutes = set()
+        for t_str in times_list:
+            hours, mins = t_str.split(':')
+            minutes.add(int(hours) * 60 + int(mins))
+        rows.extend(DoseSchedule(medication_id=med.id, minute_of_day=m) for m in minutes)
+    DoseSchedule.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0014_symptom'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoseSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute_of_day', models.PositiveSmallIntegerField()),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='medicines.medication')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['minute_of_day'], name='medicines_d_minute__1bfba4_idx')],
+                'unique_together': {('medication', 'minute_of_day')},
+            },
+        ),
+        migrations.RunPython(backfill_schedule, migrations.RunPython.noop),
+    ]
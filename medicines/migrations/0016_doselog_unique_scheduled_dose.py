@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:14
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def drop_duplicate_dose_logs(apps, schema_editor):
+    """Keep one log per scheduled dose, preferring a recorded status over 'pending'."""
+    DoseLog = apps.get_model('medicines', 'DoseLog')
+    rank = {'taken': 0, 'missed': 1}
+
+    duplicates = (
+        DoseLog.objects
+        .values('medication_id', 'user_id', 'scheduled_time')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        logs = list(DoseLog.objects.filter(
+            medication_id=dup['medication_id'],
+            user_id=dup['user_id'],
+            scheduled_time=dup['scheduled_time'],
+        ).order_by('id'))
+        keep = min(logs, key=lambda log: rank.get(log.status, 2))
+        DoseLog.objects.filter(id__in=[log.id for log in logs if log.id != keep.id]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0015_doseschedule'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_dose_logs, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='doselog',
+            unique_together={('medication', 'user', 'scheduled_time')},
+        ),
+    ]
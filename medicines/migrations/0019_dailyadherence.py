@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_adherence(apps, schema_editor):
+    """Roll up the existing DoseLog history, as medicines.adherence.rebuild_daily_adherence does."""
+    DoseLog = apps.get_model('medicines', 'DoseLog')
+    DailyAdherence = apps.get_model('medicines', 'DailyAdherence')
+
+    counts = (
+        DoseLog.objects
+        .annotate(day=TruncDate('scheduled_time'))
+        .values('user_id', 'day')
+        .annotate(
+            expected=Count('id'),
+            taken=Count('id', filter=Q(status='taken')),
+            missed=Count('id', filter=Q(status='missed')),
+        )
+        .order_by()
+    )
+    DailyAdherence.objects.bulk_create(
+        (
+            DailyAdherence(user_id=row['user_id'], date=row['day'], expected=row['expected'], taken=row['taken'], missed=row['missed'])
+            for row in counts.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0018_pushsubscription_health'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAdherence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('expected', models.PositiveIntegerField(default=0)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('missed', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_adherence', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_adherence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 08:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0019_dailyadherence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='doselog',
+            constraint=models.UniqueConstraint(fields=('user', 'medication', 'scheduled_time'), name='unique_scheduled_dose'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='doselog',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='doselog',
+            index=models.Index(fields=['user', 'scheduled_time'], name='medicines_d_user_id_adf705_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doselog',
+            index=models.Index(fields=['user', 'status', 'scheduled_time'], name='medicines_d_user_id_04eef4_idx'),
+        ),
+    ]
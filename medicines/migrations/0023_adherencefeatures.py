@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0022_riskscore'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdherenceFeatures',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('taken', models.PositiveIntegerField(default=0)),
+                ('recent', models.PositiveIntegerField(default=0)),
+                ('recent_taken', models.PositiveIntegerField(default=0)),
+                ('next_dose', models.DateTimeField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adherence_features', to='medicines.medication')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adherence_features', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['computed_at'], name='medicines_a_compute_b95247_idx')],
+                'unique_together': {('user', 'medication')},
+            },
+        ),
+    ]
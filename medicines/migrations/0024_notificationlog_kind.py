@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medicines', '0023_adherencefeatures'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='notificationlog',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='kind',
+            field=models.CharField(choices=[('reminder', 'Reminder'), ('pre_reminder', 'Pre-reminder')], default='reminder', max_length=12),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationlog',
+            unique_together={('medication', 'sent_date', 'sent_time', 'kind')},
+        ),
+    ]
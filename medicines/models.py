@@ -1,17 +1,53 @@
 # medicines/models.py
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 from django.utils import timezone
+import datetime
 import random
+import re
 import string
 
+from medicines.dashboard_cache import invalidate_dashboard
+
 FREQUENCY_CHOICES = [
     ("DAILY", "Daily"),
     ("WEEKLY", "Weekly"),
     ("MONTHLY", "Monthly"),
 ]
 
+
+def time_to_minute(t_str):
+    """Convert an "HH:MM" string into minutes since midnight."""
+    hours, minutes = t_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+TIME_FORMAT = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+
+def times_to_minutes(times):
+    """Minutes since midnight of a list of "HH:MM" strings; ValidationError if any is malformed."""
+    if not isinstance(times, list):
+        raise ValidationError('Dose times must be a list of "HH:MM" times.')
+    invalid = [t for t in times if not isinstance(t, str) or not TIME_FORMAT.match(t)]
+    if invalid:
+        raise ValidationError(f'Invalid dose time(s) {", ".join(repr(t) for t in invalid)}: use "HH:MM".')
+    return {time_to_minute(t_str) for t_str in times}
+
+
+def minute_to_time(minute):
+    """Convert minutes since midnight back into an "HH:MM" string."""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def minute_on_day(day, minute):
+    """Aware local datetime of `minute` (since midnight) on `day`."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time(minute // 60, minute % 60)))
+
+
 class Medication(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True) 
     pill_name = models.CharField(max_length=100)
@@ -28,10 +64,72 @@ class Medication(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        # Keep the minute-of-day index in step with `times`: validated before anything is
+        # written, then saved together with the row
+        update_fields = kwargs.get("update_fields")
+        sync = update_fields is None or "times" in update_fields
+        minutes = times_to_minutes(self.times) if sync else None
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if sync:
+                self.sync_schedule(minutes)
+        if self.user_id:
+            invalidate_dashboard(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        # The cascade removes this medication's DoseLogs: the rollups of the days they
+        # were on are recomputed afterwards (imported here, they import this module)
+        from medicines.adherence import aggregate_daily
+        from medicines.dose_events import dose_logs_changed
+
+        user_id = self.user_id
+        user_days = {(row['user_id'], row['day']) for row in aggregate_daily(self.logs.all())}
+        result = super().delete(*args, **kwargs)
+        dose_logs_changed(user_days)
+        if user_id:
+            invalidate_dashboard(user_id)
+        return result
+
+    def sync_schedule(self, minutes=None):
+        """Rebuild the DoseSchedule rows for this medication from `times` (or its parsed `minutes`)."""
+        if minutes is None:
+            minutes = times_to_minutes(self.times)
+
+        existing = set(self.schedule.values_list("minute_of_day", flat=True))
+        stale = existing - minutes
+        if stale:
+            self.schedule.filter(minute_of_day__in=stale).delete()
+        DoseSchedule.objects.bulk_create(
+            [DoseSchedule(medication=self, minute_of_day=m) for m in sorted(minutes - existing)]
+        )
+
     def __str__(self):
         username = self.user.username if self.user else "N/A"
         return f"{self.pill_name} - {self.dosage} ({username})"
 
+
+class DoseSchedule(models.Model):
+    """Minute-of-day index over Medication.times; hot paths read this instead of parsing `times`."""
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name="schedule")
+    minute_of_day = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ["medication", "minute_of_day"]
+        indexes = [
+            models.Index(fields=["minute_of_day"]),  # One lookup per tick
+        ]
+
+    @property
+    def time_str(self):
+        return minute_to_time(self.minute_of_day)
+
+    def scheduled_on(self, day):
+        return minute_on_day(day, self.minute_of_day)
+
+    def __str__(self):
+        return f"{self.medication.pill_name} @ {self.time_str}"
+
 # --------------------------------------------------------------------------------------------------
 
 class PushSubscription(models.Model):
@@ -41,17 +139,59 @@ class PushSubscription(models.Model):
     auth = models.TextField(default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Delivery health, maintained by the reminder worker
+    failure_count = models.PositiveIntegerField(default=0)  # consecutive failed pushes
+    slow_count = models.PositiveIntegerField(default=0)  # consecutive pushes slower than PUSH_SLOW_SECONDS
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_low_priority(self):
+        """Repeatedly slow or failing endpoints are tried after the healthy ones."""
+        strikes = settings.PUSH_LOW_PRIORITY_STRIKES
+        return self.slow_count >= strikes or self.failure_count >= strikes
+
     def __str__(self):
         return f"{self.user.username} subscription"
         
 class NotificationLog(models.Model):
+    """Delivery ledger: one row per reminder slot (and kind), claimed before the push is sent."""
+    STATUS_CHOICES = (
+        ('claimed', 'Claimed'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+    KIND_CHOICES = (
+        ('reminder', 'Reminder'),
+        ('pre_reminder', 'Pre-reminder'),  # RISK_PRE_REMINDER_MINUTES early, for high-risk doses
+    )
+
     medication = models.ForeignKey(Medication, on_delete=models.CASCADE)
     sent_date = models.DateField()  
     sent_time = models.CharField(max_length=5)  
     sent_at = models.DateTimeField(auto_now_add=True) 
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='claimed')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES, default='reminder')
     
     class Meta:
-        unique_together = ['medication', 'sent_date', 'sent_time']
+        unique_together = ['medication', 'sent_date', 'sent_time', 'kind']
+        indexes = [
+            models.Index(fields=['status', 'sent_date']),  # Resuming unsent slots
+        ]
+
+    @property
+    def scheduled_time(self):
+        """The slot this row claims, as an aware local datetime."""
+        minute = time_to_minute(self.sent_time)
+        slot = datetime.datetime.combine(self.sent_date, datetime.time(minute // 60, minute % 60))
+        return timezone.make_aware(slot)
+
+    @property
+    def due_at(self):
+        """When the push goes out: at the dose, or RISK_PRE_REMINDER_MINUTES before it for a pre-reminder."""
+        if self.kind == 'pre_reminder':
+            return self.scheduled_time - datetime.timedelta(minutes=settings.RISK_PRE_REMINDER_MINUTES)
+        return self.scheduled_time
     
     def __str__(self):
         return f"{self.medication.pill_name} - {self.sent_time} on {self.sent_date}"
@@ -70,10 +210,108 @@ class DoseLog(models.Model):
 
     class Meta:
         ordering = ['scheduled_time']
+        constraints = [
+            # One log per scheduled dose, so reminder ticks can bulk insert idempotently.
+            # Its index also serves (user, medication, scheduled_time) lookups.
+            models.UniqueConstraint(fields=['user', 'medication', 'scheduled_time'], name='unique_scheduled_dose'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'scheduled_time']),  # Day/range views, recent history
+            models.Index(fields=['user', 'status', 'scheduled_time']),  # Status sweeps, last missed dose, summaries
+        ]
 
     def __str__(self):
         return f"{self.medication.pill_name} - {self.status} @ {self.scheduled_time.strftime('%Y-%m-%d %H:%M')}"  
 
+class DailyAdherence(models.Model):
+    """Per-user, per-day rollup of DoseLog rows, kept current by medicines.adherence."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_adherence')
+    date = models.DateField()
+    expected = models.PositiveIntegerField(default=0)  # doses scheduled (logged) that day
+    taken = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'date']
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.user.username} {self.date}: {self.taken}/{self.expected} taken"
+
+class MonthlyAdherence(models.Model):
+    """Per-user, per-medication summary of a closed month whose DoseLogs were archived (compact_dose_logs)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_adherence')
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='monthly_adherence')
+    month = models.DateField()  # first day of the local month
+    expected = models.PositiveIntegerField(default=0)
+    taken = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'medication', 'month']
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.user.username} {self.month:%Y-%m} {self.medication.pill_name}: {self.taken}/{self.expected} taken"
+
+class DoseLogArchive(models.Model):
+    """Cold storage for DoseLog rows of compacted months; rows keep their DoseLog id."""
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='archived_logs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+    scheduled_time = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=DoseLog.STATUS_CHOICES)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['scheduled_time']
+        indexes = [
+            models.Index(fields=['user', 'scheduled_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.medication.pill_name} - {self.status} @ {self.scheduled_time.strftime('%Y-%m-%d %H:%M')} (archived)"
+
+class RiskScore(models.Model):
+    """Latest predicted probability that the user misses doses of this medication (score_adherence_risk)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='risk_scores')
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='risk_scores')
+    miss_probability = models.FloatField()
+    scored_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'medication']
+        indexes = [
+            models.Index(fields=['miss_probability']),  # High-risk lookups
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.medication.pill_name}: {self.miss_probability:.2f}"
+
+class AdherenceFeatures(models.Model):
+    """
+    Stored adherence-model inputs of a (user, medication) pair: the dose counts that
+    feature_extractor.features_from_counts turns into its feature row, as of `computed_at`.
+    Kept current by medicines.utils.feature_store.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='adherence_features')
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='adherence_features')
+    total = models.PositiveIntegerField(default=0)  # logs scheduled before computed_at
+    taken = models.PositiveIntegerField(default=0)
+    recent = models.PositiveIntegerField(default=0)  # the same over the 4 days before computed_at
+    recent_taken = models.PositiveIntegerField(default=0)
+    next_dose = models.DateTimeField(null=True, blank=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'medication']
+        indexes = [
+            models.Index(fields=['computed_at']),  # Stale rows
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.medication.pill_name}: {self.taken}/{self.total} taken"
+
 class GoogleCredentials(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     access_token = models.TextField()
@@ -1,11 +1,98 @@
-from pywebpush import webpush
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
 from django.conf import settings
 
+VAPID_SUBJECT = "mailto:medication-tracker@example.com"
+VAPID_TOKEN_LIFETIME = 12 * 60 * 60  # seconds, same as pywebpush's default
+VAPID_REFRESH_MARGIN = 5 * 60  # re-sign this long before the token expires
+
+
+class PushClient:
+    """
+    Web push sender that keeps its expensive state between notifications:
+    the VAPID key is parsed once, the signed VAPID JWT is reused per push-service
+    origin until shortly before it expires, and each origin gets a pooled
+    keep-alive HTTP session. Safe to share between threads.
+    """
+
+    def __init__(self, private_key, subject=VAPID_SUBJECT, pool_size=None):
+        if os.path.isfile(private_key):
+            self.vapid = Vapid.from_file(private_key_file=private_key)
+        else:
+            self.vapid = Vapid.from_string(private_key=private_key)
+        self.subject = subject
+        self.pool_size = pool_size or settings.PUSH_WORKERS
+        self._headers = {}  # origin -> (expires_at, headers)
+        self._sessions = {}  # origin -> requests.Session
+        self._lock = threading.Lock()
+
+    def vapid_headers(self, origin):
+        """Signed VAPID headers for `origin`, re-signed only when close to expiry."""
+        now = time.time()
+        with self._lock:
+            cached = self._headers.get(origin)
+            if cached and cached[0] - VAPID_REFRESH_MARGIN > now:
+                return cached[1]
+
+            expires_at = int(now) + VAPID_TOKEN_LIFETIME
+            headers = self.vapid.sign({"sub": self.subject, "aud": origin, "exp": expires_at})
+            self._headers[origin] = (expires_at, headers)
+            return headers
+
+    def session(self, origin):
+        """The keep-alive session for `origin`, sized for the reminder worker pool."""
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[origin] = session
+            return session
+
+    def send(self, subscription_info, data, timeout=None, ttl=0):
+        """Encrypt and send one notification; raises WebPushException like pywebpush.webpush."""
+        url = urlparse(subscription_info["endpoint"])
+        origin = f"{url.scheme}://{url.netloc}"
+
+        response = WebPusher(subscription_info, requests_session=self.session(origin)).send(
+            data,
+            dict(self.vapid_headers(origin)),
+            ttl=ttl,
+            timeout=timeout,
+        )
+        if response.status_code > 202:
+            raise WebPushException(
+                "Push failed: {} {}\nResponse body:{}".format(
+                    response.status_code, response.reason, response.text
+                ),
+                response=response,
+            )
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_push_client():
+    """Process-wide PushClient built from settings.VAPID_PRIVATE_KEY on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PushClient(settings.VAPID_PRIVATE_KEY)
+    return _client
+
+
 def send_web_push(subscription_info, message):
     """Send a web push notification to a specific subscription"""
-    webpush(
-        subscription_info=subscription_info,
-        data=message,
-        vapid_private_key=settings.VAPID_PRIVATE_KEY,
-        vapid_claims={"sub": "mailto:medication-tracker@example.com"}
-    )
+    get_push_client().send(subscription_info, message)
@@ -0,0 +1,463 @@
+# medicines/reminders.py
+"""Building blocks for the medication reminder tick (see run_medication_check)."""
+import json
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Mod
+from django.utils import timezone
+from pywebpush import WebPushException
+
+from medicines.adherence import local_day
+from medicines.dose_events import dose_logs_changed
+from medicines.models import DoseLog, DoseSchedule, NotificationLog, PushSubscription
+from medicines.notifications import get_push_client
+
+
+def minute_of_day(dt):
+    """Minutes since local midnight for an aware, localized datetime."""
+    return dt.hour * 60 + dt.minute
+
+
+def minute_slot(dt):
+    """Truncate an aware datetime to its local HH:MM reminder slot."""
+    return timezone.localtime(dt).replace(second=0, microsecond=0)
+
+
+def slots_between(start, end):
+    """Every minute slot after `start` up to and including `end`."""
+    slots = []
+    slot = minute_slot(start) + timedelta(minutes=1)
+    while slot <= end:
+        slots.append(minute_slot(slot))
+        slot += timedelta(minutes=1)
+    return slots
+
+
+def parse_shard(value):
+    """Parse an "N/M" shard spec into (index, count)."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected N/M")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', N must be between 0 and M-1")
+    return index, count
+
+
+def in_shard(queryset, user_field, shard):
+    """Restrict `queryset` to the users of one shard (user_id modulo shard count)."""
+    if shard is None:
+        return queryset
+    index, count = shard
+    return queryset.annotate(user_shard=Mod(user_field, count)).filter(user_shard=index)
+
+
+def seconds_until_next_minute(now):
+    """Wall-clock seconds left until the next minute boundary."""
+    return (minute_slot(now) + timedelta(minutes=1) - now).total_seconds()
+
+
+def sleep_until_next_minute():
+    """
+    Sleep until the next minute boundary, timed on the monotonic clock so the wait is
+    unaffected by wall-clock adjustments and by how long the tick itself took.
+    """
+    deadline = time.monotonic() + seconds_until_next_minute(timezone.localtime(timezone.now()))
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(remaining)
+
+
+def due_doses(slots, shard=None, min_miss_probability=None):
+    """
+    Doses scheduled in any of `slots`, read from the DoseSchedule index in one query.
+    With `min_miss_probability`, only those whose RiskScore is at least that high.
+    Returns: list of {'med': Medication, 'scheduled_time': slot}
+    """
+    by_minute = defaultdict(list)
+    for slot in slots:
+        by_minute[minute_of_day(slot)].append(slot)
+    if not by_minute:
+        return []
+
+    rows = (
+        DoseSchedule.objects
+        .filter(minute_of_day__in=list(by_minute), medication__user__isnull=False)
+        .select_related('medication__user')
+    )
+    if min_miss_probability is not None:
+        rows = rows.filter(
+            medication__risk_scores__user=F('medication__user'),
+            medication__risk_scores__miss_probability__gte=min_miss_probability,
+        )
+    rows = in_shard(rows, 'medication__user_id', shard)
+    return [
+        {'med': row.medication, 'scheduled_time': slot}
+        for row in rows
+        for slot in by_minute[row.minute_of_day]
+    ]
+
+
+def pre_reminder_doses(slots, shard=None):
+    """
+    High-risk doses scheduled RISK_PRE_REMINDER_MINUTES after any of `slots`: those whose
+    RiskScore (refreshed in batch by score_adherence_risk) is at least
+    RISK_PRE_REMINDER_THRESHOLD, minus any already logged as taken. The tick only reads
+    stored scores, never runs the model. Returns due_doses' shape.
+    """
+    lead = settings.RISK_PRE_REMINDER_MINUTES
+    if lead <= 0:
+        return []
+    doses = due_doses(
+        [minute_slot(slot + timedelta(minutes=lead)) for slot in slots],
+        shard,
+        min_miss_probability=settings.RISK_PRE_REMINDER_THRESHOLD,
+    )
+    if not doses:
+        return []
+    taken = set(
+        DoseLog.objects.filter(
+            medication_id__in={dose['med'].id for dose in doses},
+            scheduled_time__in={dose['scheduled_time'] for dose in doses},
+            status='taken',
+        ).values_list('medication_id', 'scheduled_time')
+    )
+    return [dose for dose in doses if (dose['med'].id, dose['scheduled_time']) not in taken]
+
+
+# ===========================
+# LEDGER STAGE
+# ===========================
+
+def claim_slots(doses, kind='reminder'):
+    """
+    Claim every (medication, date, minute) slot in the NotificationLog ledger with one bulk insert.
+    Slots that already have a row of this kind (sent, failed or claimed) are left untouched.
+    """
+    NotificationLog.objects.bulk_create(
+        [
+            NotificationLog(
+                medication=dose['med'],
+                sent_date=dose['scheduled_time'].date(),
+                sent_time=dose['scheduled_time'].strftime("%H:%M"),
+                kind=kind,
+            )
+            for dose in doses
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def unsent_claims(now, window=None, shard=None):
+    """
+    Claimed but not yet sent ledger rows that fell due within the last `window` minutes.
+    This picks up this tick's own claims as well as those left behind by an interrupted tick.
+    Pre-reminders whose dose has come meanwhile are dropped: the reminder itself covers it.
+    """
+    window = settings.REMINDER_CATCH_UP_MINUTES if window is None else window
+    oldest = minute_slot(now) - timedelta(minutes=window)
+
+    claims = (
+        NotificationLog.objects
+        .filter(status='claimed', sent_date__gte=oldest.date(), medication__user__isnull=False)
+        .select_related('medication__user')
+    )
+    claims = in_shard(claims, 'medication__user_id', shard)
+    return [
+        claim for claim in claims
+        if oldest <= claim.due_at <= now and (claim.kind == 'reminder' or now < claim.scheduled_time)
+    ]
+
+
+def record_deliveries(results):
+    """Close the ledger rows of a dispatched tick: one update for sent, one for failed."""
+    sent_ids = [claim.id for r in results if r['sent'] for claim in r['job']['claims']]
+    failed_ids = [claim.id for r in results if not r['sent'] for claim in r['job']['claims']]
+    if sent_ids:
+        NotificationLog.objects.filter(id__in=sent_ids).update(status='sent')
+    if failed_ids:
+        NotificationLog.objects.filter(id__in=failed_ids).update(status='failed')
+
+
+# ===========================
+# MATERIALIZATION STAGE
+# ===========================
+
+def materialize_dose_logs(doses):
+    """
+    Make sure a DoseLog exists for every dose.
+    One bulk insert (duplicates are ignored by the unique constraint) plus one read back.
+    Returns: {(medication_id, scheduled_time): DoseLog}
+    """
+    if not doses:
+        return {}
+
+    DoseLog.objects.bulk_create(
+        [
+            DoseLog(
+                medication=dose['med'],
+                user_id=dose['med'].user_id,
+                scheduled_time=dose['scheduled_time'],
+                status='pending',
+            )
+            for dose in doses
+        ],
+        ignore_conflicts=True,
+    )
+    logs = DoseLog.objects.filter(
+        medication_id__in={dose['med'].id for dose in doses},
+        scheduled_time__in={dose['scheduled_time'] for dose in doses},
+    )
+    return {(log.medication_id, log.scheduled_time): log for log in logs}
+
+
+def subscriptions_by_user(user_ids):
+    """Prefetch the push subscriptions of every affected user in one query."""
+    subs = defaultdict(list)
+    for sub in PushSubscription.objects.filter(user_id__in=set(user_ids)).order_by('id'):
+        subs[sub.user_id].append(sub)
+    return subs
+
+
+# ===========================
+# DISPATCH STAGE
+# ===========================
+
+def build_reminder_payload(doses, kind='reminder', scheduled_time=None):
+    """
+    One notification for every dose a user has due in the same minute.
+    `doses` is a list of {'med': Medication, 'dose_log': DoseLog}. A pre-reminder
+    announces doses coming up at `scheduled_time` instead; it carries no dose log ids,
+    since its doses have no DoseLog yet and can't be marked from it.
+    """
+    pills = []
+    for dose in doses:
+        pill = {"pill_name": dose['med'].pill_name, "dosage": dose['med'].dosage}
+        if kind != 'pre_reminder':
+            pill["dose_log_id"] = dose['dose_log'].id if dose['dose_log'] else None
+        pills.append(pill)
+    title = " Medicine Reminder"
+    if kind == 'pre_reminder':
+        title = " Upcoming Medicine"
+        listed = ", ".join(f"{pill['pill_name']} ({pill['dosage']} mg)" for pill in pills)
+        body = f"Coming up at {timezone.localtime(scheduled_time).strftime('%H:%M')}: {listed}"
+    elif len(pills) == 1:
+        body = f"Time to take {pills[0]['pill_name']} ({pills[0]['dosage']} mg)"
+    else:
+        listed = ", ".join(f"{pill['pill_name']} ({pill['dosage']} mg)" for pill in pills)
+        body = f"Time to take {len(pills)} medicines: {listed}"
+
+    # SIMPLE NOTIFICATION - No action buttons
+    data = {
+        "url": "/dashboard/",  # Always redirect to dashboard
+        "pills": pills,
+    }
+    if kind != 'pre_reminder':
+        data["dose_log_ids"] = [pill['dose_log_id'] for pill in pills]
+    return json.dumps({
+        "title": title,
+        "body": body,
+        "data": data,
+    })
+
+
+def coalesce_jobs(claims, dose_logs, subs):
+    """
+    Group the claimed doses into one push job per user, minute and kind, so a user with
+    several medications at 08:00 gets a single encrypted notification instead of one each.
+    """
+    grouped = defaultdict(list)
+    for claim in claims:
+        scheduled_time = claim.scheduled_time
+        grouped[(claim.medication.user_id, scheduled_time, claim.kind)].append({
+            'med': claim.medication,
+            'claim': claim,
+            'dose_log': dose_logs.get((claim.medication_id, scheduled_time)),
+        })
+
+    jobs = []
+    for (user_id, scheduled_time, kind), doses in grouped.items():
+        jobs.append({
+            'user': doses[0]['med'].user,
+            'scheduled_time': scheduled_time,
+            'kind': kind,
+            'doses': doses,
+            'claims': [dose['claim'] for dose in doses],
+            'subscriptions': subs[user_id],
+            'payload': build_reminder_payload(doses, kind, scheduled_time),
+        })
+    return jobs
+
+
+def send_reminder(job, timeout):
+    """
+    Push one reminder job, trying the user's subscriptions in order until one accepts it.
+    Returns a result dict with the job, whether it was sent, the last error, the latency
+    and one entry per subscription attempt (used for health tracking).
+    """
+    started = time.perf_counter()
+    error = None
+    attempts = []
+
+    for sub in job['subscriptions']:
+        if not sub.p256dh or not sub.auth:
+            continue
+
+        attempt_started = time.perf_counter()
+        try:
+            get_push_client().send(
+                subscription_info={
+                    "endpoint": sub.endpoint,
+                    "keys": {
+                        "p256dh": sub.p256dh,
+                        "auth": sub.auth
+                    }
+                },
+                data=job['payload'],
+                timeout=timeout,
+            )
+            attempts.append({'subscription': sub, 'ok': True, 'status_code': None,
+                             'latency': time.perf_counter() - attempt_started})
+            return {'job': job, 'sent': True, 'error': None, 'attempts': attempts,
+                    'latency': time.perf_counter() - started}
+        except (WebPushException, requests.RequestException) as e:
+            # A slow or broken endpoint only costs this job, not the whole tick
+            error = e
+            response = getattr(e, 'response', None)
+            attempts.append({'subscription': sub, 'ok': False,
+                             'status_code': getattr(response, 'status_code', None),
+                             'latency': time.perf_counter() - attempt_started})
+
+    return {'job': job, 'sent': False, 'error': error, 'attempts': attempts,
+            'latency': time.perf_counter() - started}
+
+
+def prioritize_jobs(jobs):
+    """
+    Order each job's subscriptions healthy-first, then put jobs that only have low-priority
+    endpoints in a second lane behind everyone else.
+    """
+    for job in jobs:
+        job['subscriptions'] = sorted(job['subscriptions'], key=lambda sub: (sub.is_low_priority, sub.id))
+    return sorted(
+        jobs,
+        key=lambda job: all(sub.is_low_priority for sub in job['subscriptions']),
+    )
+
+
+def dispatch_reminders(jobs, workers=None, timeout=None):
+    """Send every job collected for a tick through a bounded thread pool, healthy lane first."""
+    if not jobs:
+        return []
+
+    workers = workers or settings.PUSH_WORKERS
+    timeout = timeout or settings.PUSH_TIMEOUT
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda job: send_reminder(job, timeout), prioritize_jobs(jobs)))
+
+
+def record_subscription_health(results, now):
+    """
+    Fold a tick's push attempts into the PushSubscription health counters with a fixed
+    number of queries. Endpoints the push service reports as gone (404/410) are deleted.
+    """
+    gone, succeeded, failed, slow, fast = set(), set(), set(), set(), set()
+    for result in results:
+        for attempt in result['attempts']:
+            sub_id = attempt['subscription'].id
+            if attempt['status_code'] in (404, 410):
+                gone.add(sub_id)
+                continue
+            (succeeded if attempt['ok'] else failed).add(sub_id)
+            (slow if attempt['latency'] > settings.PUSH_SLOW_SECONDS else fast).add(sub_id)
+
+    if gone:
+        PushSubscription.objects.filter(id__in=gone).delete()
+    if succeeded:
+        PushSubscription.objects.filter(id__in=succeeded).update(failure_count=0, last_success_at=now)
+    if failed - succeeded:
+        PushSubscription.objects.filter(id__in=failed - succeeded).update(
+            failure_count=F('failure_count') + 1, last_failure_at=now
+        )
+    if slow:
+        PushSubscription.objects.filter(id__in=slow).update(slow_count=F('slow_count') + 1)
+    if fast - slow:
+        PushSubscription.objects.filter(id__in=fast - slow).update(slow_count=0)
+    return len(gone)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of `values`; 0 when there is nothing to rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+# ===========================
+# TICK
+# ===========================
+
+def process_slots(slots, now, workers=None, timeout=None, shard=None):
+    """
+    Run the whole reminder pipeline for one or more minute slots in a single batched pass:
+    claim the slots in the ledger (plus pre-reminders for high-risk doses coming up),
+    materialize the DoseLogs, coalesce them into one push per user and minute, dispatch and
+    record the outcome. With `shard`, only that shard's users are handled, so several workers can split the load.
+    """
+    claim_slots(due_doses(slots, shard))
+    claim_slots(pre_reminder_doses(slots, shard), kind='pre_reminder')
+    claims = unsent_claims(now, shard=shard)
+
+    # Pre-reminders are ahead of their dose: no DoseLog yet
+    doses = [{'med': claim.medication, 'scheduled_time': claim.scheduled_time} for claim in claims if claim.kind == 'reminder']
+    dose_logs = materialize_dose_logs(doses)
+    dose_logs_changed(
+        ((dose['med'].user_id, local_day(dose['scheduled_time'])) for dose in doses),
+        pairs=((dose['med'].user_id, dose['med'].id) for dose in doses),
+    )
+    subs = subscriptions_by_user(claim.medication.user_id for claim in claims)
+
+    jobs = coalesce_jobs(claims, dose_logs, subs)
+
+    results = dispatch_reminders(jobs, workers, timeout)
+    record_deliveries(results)
+    record_subscription_health(results, now)
+    return results
+
+
+def pending_slots(last_slot, now, window=None):
+    """
+    Minute slots still to process: everything after `last_slot` up to `now`, so minutes skipped
+    by a slow tick are not lost. Capped at `window` minutes; just the current minute on the first tick.
+    """
+    if last_slot is None:
+        return [minute_slot(now)]
+    window = settings.REMINDER_CATCH_UP_MINUTES if window is None else window
+    oldest = minute_slot(now) - timedelta(minutes=window)
+    return slots_between(max(last_slot, oldest), now)
+
+
+def catch_up_slots(now, window=None, shard=None):
+    """
+    Minute slots missed since the last ledger claim (e.g. after downtime), capped at `window` minutes.
+    The current minute is always included.
+    """
+    window = settings.REMINDER_CATCH_UP_MINUTES if window is None else window
+    oldest = minute_slot(now) - timedelta(minutes=window)
+
+    claims = in_shard(NotificationLog.objects.all(), 'medication__user_id', shard)
+    last_claim = claims.order_by('-sent_at').values_list('sent_at', flat=True).first()
+    start = max(last_claim, oldest) if last_claim else minute_slot(now) - timedelta(minutes=1)
+    return slots_between(start, now)
@@ -1,3 +1,659 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from pywebpush import WebPushException
+
+from chatbot import memory
+from chatbot.nodes.db_query_node import db_query_node
+from medicines.adherence import adherence_totals, compact_dose_logs, rebuild_daily_adherence
+from medicines.dashboard_cache import dashboard_etag, invalidate_dashboard
+from medicines.dose_events import dose_log_changed
+from medicines.dose_stream import broker
+from medicines.models import (
+    AdherenceFeatures, DailyAdherence, DoseLog, DoseLogArchive, DoseSchedule, Medication, MonthlyAdherence,
+    NotificationLog, PushSubscription, RiskScore,
+)
+from medicines.reminders import catch_up_slots, claim_slots, due_doses, minute_slot, process_slots, unsent_claims
+from medicines.utils.feature_extractor import FEATURES, archived_counts, extract_features
+from medicines.utils.feature_store import refresh_adherence_features, stored_features
+from medicines.utils.training import chunk_examples, iter_dose_chunks, iter_examples
+from medicines import views
+from medicines.views import _dose_status_events
+
+
+class FeatureParityTests(TestCase):
+    """Training, serving and the feature store must build the same feature vectors."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = User.objects.create(username='patient')
+        self.med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times_per_day=2, times=['08:00', '20:00'])
+        other = Medication.objects.create(user=self.user, pill_name='Aspirin', dosage=75, times_per_day=1, times=['09:00'])
+        # Unresolved pending logs in the past (the reminder worker creates them), and the
+        # future pending logs the dashboard creates for the rest of today
+        statuses = ['taken', 'pending', 'pending', 'missed', 'taken', 'pending', 'taken', 'missed']
+        for i, status in enumerate(statuses):
+            DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=self.now - timedelta(hours=12 * (len(statuses) - i)), status=status)
+        for hours in (2, 14):
+            DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=self.now + timedelta(hours=hours), status='pending')
+        DoseLog.objects.create(user=self.user, medication=other, scheduled_time=self.now - timedelta(hours=5), status='taken')
+
+    def test_training_matches_serving(self):
+        times_per_day = dict(Medication.objects.values_list('id', 'times_per_day'))
+        checked = 0
+        for chunk in iter_dose_chunks(self.now, chunk_size=3):
+            features, _ = chunk_examples(chunk, times_per_day)
+            for row, dose in enumerate(chunk.itertuples()):
+                med = Medication.objects.get(id=dose.medication_id)
+                served = FEATURES.vector(extract_features(self.user, med, now=dose.scheduled_time.to_pydatetime()))
+                self.assertEqual(features.iloc[row].tolist(), served, f"medication {med.id} at {dose.scheduled_time}")
+                checked += 1
+        self.assertEqual(checked, 9)
+
+    def test_pending_logs_are_not_examples(self):
+        labels = [label for _, chunk_labels, _ in iter_examples(self.now, self.now - timedelta(days=30)) for label in chunk_labels]
+        self.assertEqual(sorted(labels), [0, 0, 0, 0, 1, 1])
+
+    def test_future_logs_are_not_counted(self):
+        features = extract_features(self.user, self.med, now=self.now)
+        self.assertEqual(features['past_adherence_rate'], 3 / 8)
+
+    def test_store_matches_serving(self):
+        refresh_adherence_features([self.user.id], self.now)
+        stored = stored_features(Medication.objects.filter(user=self.user), self.now)
+        for med in Medication.objects.filter(user=self.user):
+            served = FEATURES.vector(extract_features(self.user, med, now=self.now))
+            self.assertEqual(stored.loc[med.id, list(FEATURES.columns)].tolist(), served)
+
+
+    def test_advanced_rows_match_serving(self):
+        # Rows computed 30 hours ago: logs have passed into the past and out of the window since
+        refresh_adherence_features([self.user.id], self.now - timedelta(hours=30))
+        stored = stored_features(Medication.objects.filter(user=self.user), self.now, max_age=timedelta(hours=24))
+        for med in Medication.objects.filter(user=self.user):
+            served = FEATURES.vector(extract_features(self.user, med, now=self.now))
+            self.assertEqual(stored.loc[med.id, list(FEATURES.columns)].tolist(), served)
+
+    def test_archived_months_count_everywhere(self):
+        MonthlyAdherence.objects.create(user=self.user, medication=self.med, month=(self.now - timedelta(days=120)).date().replace(day=1), expected=10, taken=9, missed=1)
+        times_per_day = dict(Medication.objects.values_list('id', 'times_per_day'))
+        for chunk in iter_dose_chunks(self.now):
+            features, _ = chunk_examples(chunk, times_per_day, archived_counts())
+            for row, dose in enumerate(chunk.itertuples()):
+                med = Medication.objects.get(id=dose.medication_id)
+                served = FEATURES.vector(extract_features(self.user, med, now=dose.scheduled_time.to_pydatetime()))
+                self.assertEqual(features.iloc[row].tolist(), served)
+        self.assertEqual(extract_features(self.user, self.med, now=self.now)['past_adherence_rate'], (3 + 9) / (8 + 10))
+
+        refresh_adherence_features([self.user.id], self.now)
+        stored = stored_features(Medication.objects.filter(user=self.user), self.now)
+        for med in Medication.objects.filter(user=self.user):
+            served = FEATURES.vector(extract_features(self.user, med, now=self.now))
+            self.assertEqual(stored.loc[med.id, list(FEATURES.columns)].tolist(), served)
+
+    def test_dose_log_change_recomputes_its_pair(self):
+        refresh_adherence_features([self.user.id])
+        log = DoseLog.objects.filter(medication=self.med, status='pending', scheduled_time__lt=timezone.now()).first()
+        log.status = 'taken'
+        log.save()
+        dose_log_changed(log)
+        row = AdherenceFeatures.objects.get(medication=self.med)
+        self.assertEqual((row.total, row.taken), (8, 4))
+
+
+class MedicationDeleteTests(TestCase):
+    def test_delete_refreshes_daily_adherence(self):
+        user = User.objects.create(username='patient')
+        kept = Medication.objects.create(user=user, pill_name='Metformin', dosage=500, times=['08:00'])
+        deleted = Medication.objects.create(user=user, pill_name='Aspirin', dosage=75, times=['09:00'])
+        for days in range(1, 5):
+            for med in (kept, deleted):
+                DoseLog.objects.create(user=user, medication=med, scheduled_time=timezone.now() - timedelta(days=days), status='taken')
+        rebuild_daily_adherence()
+        self.assertEqual(adherence_totals(user), (8, 8))
+
+        deleted.delete()
+        self.assertEqual(adherence_totals(user), (4, 4))
+        self.assertEqual(set(DailyAdherence.objects.filter(user=user).values_list('expected', 'taken')), {(1, 1)})
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class MedicationScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='patient', password='x')
+        self.client.force_login(self.user)
+
+    def test_malformed_times_are_rejected_before_saving(self):
+        for times in (['08:00:00'], [''], ['24:00'], '08:00'):
+            with self.assertRaises(ValidationError):
+                Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times=times)
+        self.assertFalse(Medication.objects.exists())
+        self.assertFalse(DoseSchedule.objects.exists())
+
+    def test_create_view_reports_malformed_times(self):
+        response = self.client.post('/medications/add/', {'pill_name': 'Metformin', 'dosage': '500', 'times': ['08:00:00']})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Medication.objects.exists())
+
+    def test_update_view_leaves_row_and_schedule_unchanged(self):
+        med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times=['08:00'])
+        response = self.client.post(f'/medications/edit/{med.pk}/', {'pill_name': 'Metformin', 'dosage': '500', 'times': ['09:00', '']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Invalid dose time', str(list(get_messages(response.wsgi_request))[0]))
+        med.refresh_from_db()
+        self.assertEqual(med.times, ['08:00'])
+        self.assertEqual(list(med.schedule.values_list('minute_of_day', flat=True)), [480])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DashboardDataTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='patient')
+        self.client.force_login(self.user)
+        Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times=['00:00'])
+
+    def test_each_request_builds_at_most_once(self):
+        with mock.patch('medicines.views._build_dashboard', wraps=views._build_dashboard) as build:
+            # The first build creates today's log and marks it missed, bumping the version
+            response = self.client.get('/api/dashboard-data/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['missed_count'], 1)
+            self.assertEqual(build.call_count, 1)
+
+            # That result wasn't cached, so the next request builds again (once) and agrees
+            response = self.client.get('/api/dashboard-data/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(build.call_count, 2)
+
+            response = self.client.get('/api/dashboard-data/', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(build.call_count, 2)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class BatchLogDosesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='patient')
+        self.client.force_login(self.user)
+        self.med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times_per_day=2, times=['08:00', '20:00'])
+        self.day = timezone.localdate()
+        self.morning = timezone.make_aware(datetime.combine(self.day, time(8, 0)))
+        self.morning_log = DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=self.morning, status='missed')
+        other = User.objects.create(username='other')
+        self.other_med = Medication.objects.create(user=other, pill_name='Aspirin', dosage=75, times=['09:00'])
+        self.other_log = DoseLog.objects.create(user=other, medication=self.other_med, scheduled_time=self.morning, status='missed')
+
+    def post(self, items):
+        return self.client.post('/api/dose-logs/batch/', json.dumps({'items': items}), content_type='application/json')
+
+    def test_log_and_slot_items(self):
+        response = self.post([
+            {'dose_log_id': self.morning_log.id, 'status': 'taken'},
+            {'med_id': self.med.id, 'time': '20:00', 'date': self.day.isoformat(), 'status': 'missed'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['applied'], 2)
+        evening = DoseLog.objects.get(medication=self.med, scheduled_time=self.morning + timedelta(hours=12))
+        self.assertEqual(body['results'], [
+            {'status': 'success', 'dose_log_id': self.morning_log.id, 'new_status': 'taken'},
+            {'status': 'success', 'dose_log_id': evening.id, 'new_status': 'missed'},
+        ])
+        self.morning_log.refresh_from_db()
+        self.assertEqual((self.morning_log.status, evening.status), ('taken', 'missed'))
+
+    def test_other_users_logs_and_medications_are_not_found(self):
+        response = self.post([
+            {'dose_log_id': self.other_log.id, 'status': 'taken'},
+            {'med_id': self.other_med.id, 'time': '09:00', 'status': 'taken'},
+        ])
+        self.assertEqual(response.json()['results'], [
+            {'status': 'error', 'message': 'Dose not found'},
+            {'status': 'error', 'message': 'Medication not found'},
+        ])
+        self.other_log.refresh_from_db()
+        self.assertEqual(self.other_log.status, 'missed')
+        self.assertEqual(DoseLog.objects.filter(medication=self.other_med).count(), 1)
+
+    def test_last_item_for_a_dose_wins(self):
+        # The same dose by id and by slot, then a new slot twice
+        response = self.post([
+            {'dose_log_id': self.morning_log.id, 'status': 'taken'},
+            {'med_id': self.med.id, 'time': '08:00', 'status': 'missed'},
+            {'med_id': self.med.id, 'time': '20:00', 'status': 'taken'},
+            {'med_id': self.med.id, 'time': '20:00', 'status': 'missed'},
+        ])
+        results = response.json()['results']
+        self.assertEqual([r['new_status'] for r in results], ['missed', 'missed', 'missed', 'missed'])
+        self.assertEqual(results[0]['dose_log_id'], self.morning_log.id)
+        self.assertEqual(results[1]['dose_log_id'], self.morning_log.id)
+        self.assertEqual(results[2]['dose_log_id'], results[3]['dose_log_id'])
+        self.assertEqual(DoseLog.objects.filter(medication=self.med).count(), 2)
+        self.assertEqual(set(DoseLog.objects.filter(medication=self.med).values_list('status', flat=True)), {'missed'})
+
+    def test_invalid_items_fail_alone(self):
+        response = self.post([
+            {'dose_log_id': self.morning_log.id, 'status': 'skipped'},
+            {'med_id': self.med.id, 'time': '8am', 'status': 'taken'},
+            {'med_id': self.med.id, 'status': 'taken'},
+            'taken',
+            {'dose_log_id': self.morning_log.id, 'status': 'taken'},
+        ])
+        body = response.json()
+        self.assertEqual(body['applied'], 1)
+        self.assertEqual([r['status'] for r in body['results']], ['error', 'error', 'error', 'error', 'success'])
+        self.assertEqual(body['results'][0]['message'], "status must be 'taken' or 'missed'")
+        self.assertEqual(body['results'][1]['message'], 'expected {dose_log_id, status} or {med_id, time, status}')
+
+    def test_malformed_body(self):
+        self.assertEqual(self.client.post('/api/dose-logs/batch/', 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post('not a list').status_code, 400)
+        self.assertEqual(self.client.get('/api/dose-logs/batch/').status_code, 405)
+
+    def test_concurrent_insert_rolls_back_the_batch(self):
+        bulk_create = DoseLog.objects.bulk_create
+        evening = self.morning + timedelta(hours=12)
+
+        def reminder_worker_first(logs, *args, **kwargs):
+            # The reminder worker logs the evening dose between the batch's read and write
+            DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=evening, status='missed')
+            return bulk_create(logs, *args, **kwargs)
+
+        with mock.patch.object(DoseLog.objects, 'bulk_create', reminder_worker_first):
+            response = self.post([
+                {'dose_log_id': self.morning_log.id, 'status': 'taken'},
+                {'med_id': self.med.id, 'time': '20:00', 'status': 'taken'},
+            ])
+        self.assertEqual(response.status_code, 409)
+        # Nothing from the batch was applied, the update included
+        self.morning_log.refresh_from_db()
+        self.assertEqual(self.morning_log.status, 'missed')
+        self.assertFalse(DoseLog.objects.filter(medication=self.med, status='taken').exists())
+
+
+class FakePushClient:
+    """Records every push; endpoints in `status_codes` fail with that HTTP status instead."""
+
+    def __init__(self, status_codes=None):
+        self.status_codes = status_codes or {}
+        self.sent = []
+
+    def send(self, subscription_info, data, timeout=None):
+        endpoint = subscription_info['endpoint']
+        if endpoint in self.status_codes:
+            raise WebPushException('push failed', response=SimpleNamespace(status_code=self.status_codes[endpoint]))
+        self.sent.append((endpoint, json.loads(data)))
+
+
+class ReminderLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='patient')
+        self.med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times=['11:57', '12:00'])
+        self.sub = PushSubscription.objects.create(user=self.user, endpoint='https://push.example/a', p256dh='key', auth='auth')
+        self.now = timezone.make_aware(datetime.combine(timezone.localdate(), time(12, 0, 30)))
+        self.slot = minute_slot(self.now)
+        self.push = FakePushClient()
+        patcher = mock.patch('medicines.reminders.get_push_client', lambda: self.push)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ledger(self):
+        return sorted(NotificationLog.objects.values_list('sent_time', 'kind', 'status'))
+
+    def test_second_run_of_a_minute_sends_nothing(self):
+        results = process_slots([self.slot], self.now, workers=1)
+        self.assertEqual([r['sent'] for r in results], [True])
+        self.assertEqual(self.ledger(), [('12:00', 'reminder', 'sent')])
+
+        self.assertEqual(process_slots([self.slot], self.now, workers=1), [])
+        self.assertEqual(len(self.push.sent), 1)
+        self.assertEqual(self.ledger(), [('12:00', 'reminder', 'sent')])
+
+    def test_interrupted_tick_resumes_its_claims(self):
+        # The 12:00 tick claimed its slot and stopped before sending
+        claim_slots(due_doses([self.slot]))
+        self.assertEqual([claim.sent_time for claim in unsent_claims(self.now)], ['12:00'])
+
+        # The next tick has nothing due itself but sends the leftover claim
+        later = self.now + timedelta(minutes=1)
+        process_slots([minute_slot(later)], later, workers=1)
+        [(endpoint, payload)] = self.push.sent
+        log = DoseLog.objects.get(medication=self.med, scheduled_time=self.slot)
+        self.assertEqual(payload['data']['dose_log_ids'], [log.id])
+        self.assertEqual(self.ledger(), [('12:00', 'reminder', 'sent')])
+        self.assertEqual(unsent_claims(later), [])
+
+    def test_catch_up_processes_only_the_skipped_minutes(self):
+        NotificationLog.objects.create(medication=self.med, sent_date=self.slot.date(), sent_time='11:55', status='sent')
+        NotificationLog.objects.update(sent_at=self.slot - timedelta(minutes=5))
+        slots = catch_up_slots(self.now)
+        self.assertEqual([slot.strftime('%H:%M') for slot in slots], ['11:56', '11:57', '11:58', '11:59', '12:00'])
+
+        results = process_slots(slots, self.now, workers=1)
+        self.assertEqual(sorted(r['job']['scheduled_time'].strftime('%H:%M') for r in results), ['11:57', '12:00'])
+        self.assertEqual(self.ledger(), [('11:55', 'reminder', 'sent'), ('11:57', 'reminder', 'sent'), ('12:00', 'reminder', 'sent')])
+
+    def test_gone_subscription_is_pruned(self):
+        backup = PushSubscription.objects.create(user=self.user, endpoint='https://push.example/b', p256dh='key', auth='auth')
+        self.push.status_codes = {self.sub.endpoint: 410}
+        [result] = process_slots([self.slot], self.now, workers=1)
+        # The next subscription took the push; the gone one is deleted
+        self.assertTrue(result['sent'])
+        self.assertEqual([endpoint for endpoint, payload in self.push.sent], [backup.endpoint])
+        self.assertEqual(list(PushSubscription.objects.values_list('id', flat=True)), [backup.id])
+
+        self.push.status_codes = {backup.endpoint: 404}
+        [result] = process_slots([self.slot - timedelta(minutes=3)], self.now, workers=1)
+        self.assertFalse(result['sent'])
+        self.assertFalse(PushSubscription.objects.exists())
+
+    def test_failed_push_is_recorded_and_not_retried(self):
+        self.push.status_codes = {self.sub.endpoint: 500}
+        [result] = process_slots([self.slot], self.now, workers=1)
+        self.assertFalse(result['sent'])
+        self.assertEqual(self.ledger(), [('12:00', 'reminder', 'failed')])
+        self.sub.refresh_from_db()
+        self.assertEqual(self.sub.failure_count, 1)
+        self.assertEqual(process_slots([self.slot], self.now, workers=1), [])
+
+    @override_settings(RISK_PRE_REMINDER_MINUTES=15, RISK_PRE_REMINDER_THRESHOLD=0.7)
+    def test_pre_reminder_has_its_own_row_and_no_dose_log_ids(self):
+        RiskScore.objects.create(user=self.user, medication=self.med, miss_probability=0.9, scored_at=self.now)
+        early = self.now - timedelta(minutes=15)
+        process_slots([minute_slot(early)], early, workers=1)
+        process_slots([self.slot], self.now, workers=1)
+
+        # One ledger row per (medication, minute, kind): both for the 12:00 dose
+        self.assertEqual(self.ledger(), [('12:00', 'pre_reminder', 'sent'), ('12:00', 'reminder', 'sent')])
+        (_, pre_reminder), (_, reminder) = self.push.sent
+        self.assertEqual(pre_reminder['body'], 'Coming up at 12:00: Metformin (500 mg)')
+        self.assertNotIn('dose_log_ids', pre_reminder['data'])
+        self.assertEqual(pre_reminder['data']['pills'], [{'pill_name': 'Metformin', 'dosage': 500}])
+        log = DoseLog.objects.get(medication=self.med, scheduled_time=self.slot)
+        self.assertEqual(reminder['data']['dose_log_ids'], [log.id])
+        self.assertEqual(reminder['data']['pills'][0]['dose_log_id'], log.id)
+
+
+class CompactionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='patient')
+        self.med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times_per_day=2, times=['08:00', '20:00'])
+        self.cutoff = timezone.localdate().replace(day=1)
+        self.old_day = timezone.make_aware(datetime.combine(self.cutoff - timedelta(days=40), datetime.min.time()))
+        for hours, status in ((8, 'taken'), (20, 'missed'), (32, 'taken')):
+            DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=self.old_day + timedelta(hours=hours), status=status)
+        DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=timezone.now() - timedelta(hours=1), status='taken')
+        rebuild_daily_adherence()
+        self.totals = adherence_totals(self.user)
+
+    def test_interrupted_run_keeps_totals(self):
+        bulk_create = DoseLogArchive.objects.bulk_create
+        chunks = []
+
+        def archive_one_chunk(*args, **kwargs):
+            if chunks:
+                raise RuntimeError('interrupted')
+            chunks.append(args)
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(DoseLogArchive.objects, 'bulk_create', archive_one_chunk):
+            with self.assertRaises(RuntimeError):
+                compact_dose_logs(self.cutoff, chunk_size=1)
+        # The first log is archived; the second one of its day is still counted there
+        self.assertEqual(DoseLogArchive.objects.count(), 1)
+        self.assertEqual(adherence_totals(self.user), self.totals)
+        first_day = DailyAdherence.objects.get(user=self.user, date=timezone.localdate(self.old_day))
+        self.assertEqual((first_day.expected, first_day.missed), (1, 1))
+
+        self.assertEqual(compact_dose_logs(self.cutoff, chunk_size=1), 2)
+        self.assertEqual(adherence_totals(self.user), self.totals)
+        self.assertFalse(DailyAdherence.objects.filter(date__lt=self.cutoff).exists())
+        self.assertEqual(DoseLog.objects.count(), 1)
+
+    def test_chatbot_history_reaches_the_archive(self):
+        compact_dose_logs(self.cutoff)
+        connection.ensure_connection()
+        state = db_query_node({'query_type': 'recent_history', 'user_id': self.user.id}, connection.connection)
+        self.assertEqual([row['status'] for row in state['db_query_result']['result']], ['taken', 'taken', 'missed', 'taken'])
+        state = db_query_node({'query_type': 'last_missed_dose', 'user_id': self.user.id}, connection.connection)
+        self.assertEqual(state['db_query_result']['result']['status'], 'missed')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'asserts SQLite query plans')
+class DoseLogQueryPlanTests(TestCase):
+    """
+    The DoseLog access patterns must stay index searches. Seeds 50 users x 20 days by
+    default; set QUERY_PLAN_FULL_SEED=1 for 1,000 users x 500 days (1M logs).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        users, days = (1000, 500) if os.environ.get('QUERY_PLAN_FULL_SEED') else (50, 20)
+        start = timezone.now() - timedelta(days=days)
+        statuses = ['taken', 'taken', 'taken', 'missed']
+        User.objects.bulk_create([User(username=f'patient{i}') for i in range(users)])
+        cls.users = list(User.objects.order_by('id'))
+        Medication.objects.bulk_create([
+            Medication(user=user, pill_name=name, dosage=100, times=['08:00'])
+            for user in cls.users for name in ('Metformin', 'Aspirin')
+        ])
+        meds = list(Medication.objects.order_by('id'))
+        for med in meds:
+            DoseLog.objects.bulk_create(
+                [
+                    DoseLog(user_id=med.user_id, medication=med, scheduled_time=start + timedelta(days=day), status=statuses[(med.id + day) % 4])
+                    for day in range(days)
+                ],
+                batch_size=1000,
+            )
+        cls.user, cls.med = cls.users[0], meds[0]
+        cls.day = start + timedelta(days=days // 2)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, columns):
+        """The query's plan searches the DoseLog index on exactly these columns."""
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {self.index_on(columns)} ', plan.replace('COVERING INDEX', 'INDEX'))
+
+    def index_on(self, columns):
+        # By columns rather than name: SQLite backs unique_scheduled_dose with an autoindex
+        with connection.cursor() as cursor:
+            for _, name, *_ in cursor.execute(f"PRAGMA index_list('{DoseLog._meta.db_table}')").fetchall():
+                if [row[2] for row in cursor.execute(f"PRAGMA index_info('{name}')").fetchall()] == columns:
+                    return name
+        self.fail(f'No DoseLog index on {columns}')
+
+    def test_scheduled_dose_lookup_uses_unique_constraint(self):
+        self.assertUsesIndex(
+            DoseLog.objects.filter(user=self.user, medication=self.med, scheduled_time=self.day),
+            ['user_id', 'medication_id', 'scheduled_time'],
+        )
+        self.assertUsesIndex(DoseLog.objects.filter(user=self.user, medication=self.med), ['user_id', 'medication_id', 'scheduled_time'])
+
+    def test_day_range_uses_user_scheduled_time_index(self):
+        self.assertUsesIndex(
+            DoseLog.objects.filter(user=self.user, scheduled_time__range=(self.day, self.day + timedelta(days=1))),
+            ['user_id', 'scheduled_time'],
+        )
+
+    def test_status_lookups_use_user_status_scheduled_time_index(self):
+        index = ['user_id', 'status', 'scheduled_time']
+        self.assertUsesIndex(DoseLog.objects.filter(user=self.user, status='missed').order_by('-scheduled_time')[:1], index)
+        self.assertUsesIndex(
+            DoseLog.objects.filter(user=self.user, status='pending', scheduled_time__lt=self.day),
+            index,
+        )
+
+
+@override_settings(DOSE_STREAM_POLL_SECONDS=0.05, ALLOWED_HOSTS=['testserver'])
+class DoseStatusStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='patient', password='x')
+        self.med = Medication.objects.create(user=self.user, pill_name='Metformin', dosage=500, times=['08:00'])
+        self.log = DoseLog.objects.create(user=self.user, medication=self.med, scheduled_time=timezone.now() - timedelta(hours=1), status='pending')
+
+    async def open_stream(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/dose-status-stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=2)
+        name, data = chunk.decode().splitlines()[:2]
+        self.assertEqual(name, 'event: dose_status')
+        return json.loads(data.removeprefix('data: '))
+
+    async def test_dose_events_publish_to_open_streams(self):
+        stream = await self.open_stream()
+        first = await self.next_event(stream)
+        self.assertEqual(first['version'], await sync_to_async(dashboard_etag)(self.user.id, timezone.localdate()))
+
+        self.log.status = 'taken'
+        await self.log.asave()
+        await sync_to_async(dose_log_changed)(self.log)
+        event = await self.next_event(stream)
+        self.assertEqual(event['doses'], [{'dose_log_id': self.log.id, 'status': 'taken'}])
+        self.assertNotEqual(event['version'], first['version'])
+        await stream.aclose()
+
+    async def test_version_poll_picks_up_other_processes_changes(self):
+        stream = await self.open_stream()
+        first = await self.next_event(stream)
+        # Another process bumping the shared version publishes nothing in this one
+        await sync_to_async(invalidate_dashboard)(self.user.id)
+        event = await self.next_event(stream)
+        self.assertEqual(event['doses'], [])
+        self.assertNotEqual(event['version'], first['version'])
+        await stream.aclose()
+
+    async def test_one_poller_per_loop_while_streams_are_open(self):
+        # The generators themselves, so closing one runs its unsubscribe
+        streams = [_dose_status_events(self.user) for _ in range(3)]
+        for stream in streams:
+            await asyncio.wait_for(anext(stream), timeout=2)
+        loop = asyncio.get_running_loop()
+        self.assertEqual([poller_loop for poller_loop in broker._pollers if poller_loop is loop], [loop])
+        for stream in streams:
+            await stream.aclose()
+        await asyncio.sleep(0.2)
+        self.assertNotIn(loop, broker._pollers)
+
+
+class FakeLLM:
+    def __init__(self, reply="", error=None):
+        self.reply, self.error, self.prompts = reply, error, []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=self.reply)
+
+
+@override_settings(CHATBOT_HISTORY_TURNS=4)
+class ConversationMemoryTests(TestCase):
+    def turns(self, count):
+        return [{'user': f'question {i}', 'assistant': f'answer {i}'} for i in range(count)]
+
+    def run_memory_node(self, llm, history, summary=''):
+        state = {
+            'user_input': 'latest question', 'response': 'latest answer',
+            'conversation_history': history, 'conversation_summary': summary,
+        }
+        with mock.patch.dict(sys.modules, {'chatbot.llm': SimpleNamespace(llm=llm)}):
+            return memory.memory_node(state)
+
+    def test_short_history_is_kept_without_summarizing(self):
+        llm = FakeLLM()
+        result = self.run_memory_node(llm, self.turns(3))
+        self.assertEqual(len(result['conversation_history']), 4)
+        self.assertEqual(result['conversation_history'][-1], {'user': 'latest question', 'assistant': 'latest answer'})
+        self.assertEqual(llm.prompts, [])
+
+    def test_older_turns_are_folded_into_the_summary(self):
+        llm = FakeLLM(reply='  takes metformin,\n worried about   dizziness ')
+        result = self.run_memory_node(llm, self.turns(4), summary='earlier summary')
+        # 5 turns > 4: the newest 2 stay verbatim, the other 3 go to the summarizer in one call
+        self.assertEqual(result['conversation_history'], [
+            {'user': 'question 3', 'assistant': 'answer 3'},
+            {'user': 'latest question', 'assistant': 'latest answer'},
+        ])
+        self.assertEqual(result['conversation_summary'], 'takes metformin, worried about dizziness')
+        [prompt] = llm.prompts
+        self.assertIn('earlier summary', prompt)
+        self.assertIn('question 0', prompt)
+        self.assertIn('question 2', prompt)
+        self.assertNotIn('question 3', prompt)
+
+    def test_summary_is_capped_and_turns_truncated(self):
+        llm = FakeLLM(reply=' '.join(['word'] * (memory.SUMMARY_MAX_WORDS + 20)))
+        history = self.turns(4)
+        history[0]['assistant'] = 'x' * (memory.TURN_MAX_CHARS * 2)
+        result = self.run_memory_node(llm, history)
+        self.assertEqual(len(result['conversation_summary'].split()), memory.SUMMARY_MAX_WORDS)
+
+        state = {'user_input': 'q' * (memory.TURN_MAX_CHARS * 2), 'response': 'a'}
+        result = memory.memory_node(state)
+        self.assertEqual(len(result['conversation_history'][0]['user']), memory.TURN_MAX_CHARS)
+
+    def test_failed_summary_keeps_the_previous_one(self):
+        llm = FakeLLM(error=RuntimeError('rate limited'))
+        with self.assertLogs('chatbot.memory', 'WARNING'):
+            result = self.run_memory_node(llm, self.turns(4), summary='earlier summary')
+        self.assertEqual(result['conversation_summary'], 'earlier summary')
+        self.assertEqual(len(result['conversation_history']), 2)
+
+
+@skipUnless(memory.SqliteSaver is not None, 'langgraph-checkpoint-sqlite is not installed')
+class BoundedCheckpointerTests(TestCase):
+    def setUp(self):
+        self.saver = memory.BoundedSqliteSaver(sqlite3.connect(':memory:', check_same_thread=False), keep=2)
+
+    def put_checkpoints(self, thread_id, count):
+        from langgraph.checkpoint.base import empty_checkpoint
+
+        ids = []
+        for step in range(count):
+            checkpoint = empty_checkpoint()
+            config = {'configurable': {'thread_id': thread_id, 'checkpoint_ns': ''}}
+            saved = self.saver.put(config, checkpoint, {'step': step}, {})
+            self.saver.put_writes(saved, [('channel', step)], task_id=f'task-{step}')
+            ids.append(checkpoint['id'])
+        return ids
+
+    def stored(self, table, thread_id):
+        with self.saver.cursor() as cur:
+            cur.execute(f"SELECT DISTINCT checkpoint_id FROM {table} WHERE thread_id = ?", (thread_id,))
+            return sorted(row[0] for row in cur.fetchall())
+
+    def test_put_keeps_only_the_latest_checkpoints(self):
+        ids = self.put_checkpoints('user_1', 5)
+        other_ids = self.put_checkpoints('user_2', 1)
+        self.assertEqual(self.stored('checkpoints', 'user_1'), sorted(ids[-2:]))
+        self.assertEqual(self.stored('writes', 'user_1'), sorted(ids[-2:]))
+        self.assertEqual(self.stored('checkpoints', 'user_2'), other_ids)
+        latest = self.saver.get_tuple({'configurable': {'thread_id': 'user_1', 'checkpoint_ns': ''}})
+        self.assertEqual(latest.checkpoint['id'], ids[-1])
+
+    def test_delete_thread_forgets_only_that_thread(self):
+        self.put_checkpoints('user_1', 2)
+        other_ids = self.put_checkpoints('user_2', 1)
+        self.saver.delete_thread('user_1')
+        self.assertEqual(self.stored('checkpoints', 'user_1'), [])
+        self.assertEqual(self.stored('writes', 'user_1'), [])
+        self.assertEqual(self.stored('checkpoints', 'user_2'), other_ids)
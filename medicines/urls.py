@@ -22,9 +22,12 @@ urlpatterns = [
 
     # API endpoints
     path('api/dashboard-data/', views.dashboard_data, name='dashboard_data'),
+    path('api/dose-status-stream/', views.dose_status_stream, name='dose_status_stream'),
+    path('api/dashboard-cache-stats/', views.dashboard_cache_stats, name='dashboard_cache_stats'),
     path('api/log-dose/', views.log_dose, name='log_dose'),
     path('api/toggle-dose-status/', views.toggle_dose_status, name='toggle_dose_status'),
     path('api/mark-dose-taken/', views.mark_dose_taken, name='mark_dose_taken'),
+    path('api/dose-logs/batch/', views.batch_log_doses, name='batch_log_doses'),
     path('api/today-dose-logs/', views.get_today_dose_logs, name='today_dose_logs'),
 
     # Notifications
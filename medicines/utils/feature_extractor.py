@@ -1,54 +1,193 @@
-from datetime import datetime, timedelta
-from medicines.models import DoseLog, Medication
-
-def extract_features(user, medication):
-    # 1. Past adherence rate for this medication
-    logs = DoseLog.objects.filter(user=user, medication=medication)
-    total = logs.count()
-    taken = logs.filter(status='taken').count()
-    past_adherence_rate = taken / total if total > 0 else 1.0
-
-    # 2. Lifestyle routine (taken all doses in last 4 days?)
-    four_days_ago = datetime.now() - timedelta(days=4)
-    recent_logs = logs.filter(scheduled_time__gte= four_days_ago)
-    if recent_logs.exists():
-        lifestyle_routine = 1 if recent_logs.filter(status='taken').count() >= 0.8*recent_logs.count() else 0
-    else:
-        lifestyle_routine = 0
+from dataclasses import dataclass
+from datetime import timedelta
 
-    # 3. Dose complexity = how many times per day
-    dose_complexity = medication.times_per_day
+import numpy as np
+import pandas as pd
+from django.db.models import Count, Min, Q, QuerySet, Sum
+from django.utils import timezone
 
-    # 4. Time of day (based on next scheduled dose)
-    next_dose = logs.filter(scheduled_time__gte=datetime.now()).order_by('scheduled_time').first()
-    if next_dose:
-        hour = next_dose.scheduled_time.hour
-    else:
-        hour = 8  # fallback: morning
-
-    if 5 <= hour < 12:
-        time_of_day = "Morning"
-    elif 12 <= hour < 17:
-        time_of_day = "Afternoon"
-    elif 17 <= hour < 21:
-        time_of_day = "Evening"
-    else:
-        time_of_day = "Night"
-
-    # 5. One-hot encoding for time_of_day
-    time_features = {
-        'Morning': 1 if time_of_day == 'Morning' else 0,
-        'Afternoon': 1 if time_of_day == 'Afternoon' else 0,
-        'Evening': 1 if time_of_day == 'Evening' else 0,
-        'Night': 1 if time_of_day == 'Night' else 0,
-    }
+from medicines.models import DoseLog, Medication, MonthlyAdherence
+
+TIME_OF_DAY = ['Morning', 'Afternoon', 'Evening', 'Night']
+COUNT_COLUMNS = ['total', 'taken', 'recent', 'recent_taken']
+
+
+@dataclass(frozen=True)
+class FeatureSchema:
+    """
+    The adherence model's input columns in one fixed order. Training records them in the
+    artifact's metadata and serving feeds them to the model by name, so neither side
+    depends on the order that a dict or pd.get_dummies happens to produce.
+    """
+    version: int
+    columns: tuple
 
-    # Final feature set
-    features = {
-        'dose_complexity': dose_complexity,
-        'past_adherence_rate': past_adherence_rate,
-        'lifestyle_routine': lifestyle_routine,
-        **time_features
+    def vector(self, features):
+        """A features dict as a list in schema order (KeyError if a column is missing)."""
+        return [features[column] for column in self.columns]
+
+    def for_model(self, features, model):
+        """
+        `features` (a DataFrame holding the schema's columns) in the order `model` was fitted
+        with. ValueError if the model was trained on other columns.
+        """
+        fitted = getattr(model, 'feature_names_in_', None)
+        if fitted is None:
+            return features[list(self.columns)]
+        if set(fitted) != set(self.columns):
+            raise ValueError(f"Model was trained on {list(fitted)}, feature schema v{self.version} has {list(self.columns)}")
+        return features[list(fitted)]
+
+
+FEATURES = FeatureSchema(
+    version=1,
+    columns=('dose_complexity', 'past_adherence_rate', 'lifestyle_routine', *TIME_OF_DAY),
+)
+
+
+def _dose_aggregates(now):
+    """
+    Conditional aggregates behind the features, for .aggregate() or a grouped .annotate():
+    counts over the logs scheduled before `now` (all of them and the last 4 days), and the
+    next dose at or after it.
+    Only past logs are counted, as in training. The pending logs _build_dashboard creates
+    for the rest of today used to count towards `total` and `recent`; they no longer do.
+    """
+    four_days_ago = now - timedelta(days=4)
+    past = Q(scheduled_time__lt=now)
+    return {
+        'total': Count('id', filter=past),
+        'taken': Count('id', filter=past & Q(status='taken')),
+        'recent': Count('id', filter=past & Q(scheduled_time__gte=four_days_ago)),
+        'recent_taken': Count('id', filter=past & Q(scheduled_time__gte=four_days_ago, status='taken')),
+        'next_dose': Min('scheduled_time', filter=Q(scheduled_time__gte=now)),
     }
 
+
+def extract_features(user, medication, now=None):
+    """The medication's features as of `now` (default: now), a dict in schema order."""
+    # One query: counts over the whole history and the last 4 days, plus the next scheduled dose
+    stats = DoseLog.objects.filter(user=user, medication=medication).aggregate(**_dose_aggregates(now or timezone.now()))
+    archived = MonthlyAdherence.objects.filter(user=user, medication=medication).aggregate(
+        total=Sum('expected'), taken=Sum('taken'),
+    )
+    for column in ('total', 'taken'):
+        stats[column] += archived[column] or 0
+    features = features_from_counts(
+        [medication.times_per_day],
+        *([stats[column]] for column in COUNT_COLUMNS),
+        hour=[stats['next_dose'].hour if stats['next_dose'] else np.nan],
+    )
+    return {column: features[column].iloc[0].item() for column in FEATURES.columns}
+
+
+def pair_counts(medications=None, now=None):
+    """
+    What features_from_counts needs for many medications at once: one DataFrame row per
+    medication (index: medication id) with its owner's `user_id`, `times_per_day`, the
+    COUNT_COLUMNS and `next_dose`, as of `now`. `total` and `taken` include the pair's
+    archived months (archived_counts).
+    `medications` is a list or QuerySet of Medication (default: all that have an owner).
+    Three queries however many medications: the medications, one grouped DoseLog aggregate
+    and one grouped MonthlyAdherence sum.
+    """
+    now = now or timezone.now()
+    if medications is None:
+        medications = Medication.objects.all()
+    if isinstance(medications, QuerySet):
+        meds = list(medications.filter(user__isnull=False).values_list('id', 'user_id', 'times_per_day'))
+        medication_ids = medications.values('id')
+    else:
+        meds = [(m.id, m.user_id, m.times_per_day) for m in medications if m.user_id is not None]
+        medication_ids = [m[0] for m in meds]
+    logs = DoseLog.objects.filter(medication_id__in=medication_ids)
+
+    meds = pd.DataFrame.from_records(meds, columns=['medication_id', 'user_id', 'times_per_day'])
+    stats = pd.DataFrame.from_records(
+        logs
+        .values('user_id', 'medication_id')
+        .annotate(**_dose_aggregates(now))
+        .order_by()
+        .values_list('user_id', 'medication_id', *COUNT_COLUMNS, 'next_dose'),
+        columns=['user_id', 'medication_id', *COUNT_COLUMNS, 'next_dose'],
+    )
+    archived = archived_counts(medication_ids).add_prefix('archived_').reset_index()
+    counts = (
+        meds
+        .merge(stats, on=['user_id', 'medication_id'], how='left')
+        .merge(archived, on=['user_id', 'medication_id'], how='left')
+        .set_index('medication_id')
+    )
+    counts[COUNT_COLUMNS] = counts[COUNT_COLUMNS].fillna(0).astype(int)
+    for column in ('total', 'taken'):
+        counts[column] += counts.pop(f'archived_{column}').fillna(0).astype(int)
+    return counts
+
+
+def archived_counts(medication_ids=None):
+    """
+    `total` and `taken` of the logs compact_dose_logs moved out of DoseLog, from their
+    MonthlyAdherence rows: a DataFrame indexed by (user_id, medication_id), one row per pair
+    with archived months (of `medication_ids` only, if given). Archived months end before
+    the hot table begins, so they only ever add to these two counts, never to the 4-day
+    window or the next dose.
+    """
+    rows = MonthlyAdherence.objects.all()
+    if medication_ids is not None:
+        rows = rows.filter(medication_id__in=medication_ids)
+    return pd.DataFrame.from_records(
+        rows
+        .values('user_id', 'medication_id')
+        .annotate(total=Sum('expected'), taken=Sum('taken'))
+        .order_by()
+        .values_list('user_id', 'medication_id', 'total', 'taken'),
+        columns=['user_id', 'medication_id', 'total', 'taken'],
+    ).astype(int).set_index(['user_id', 'medication_id'])
+
+
+def features_from_frame(counts):
+    """Features (`user_id` plus the schema's columns) of each row of a pair_counts-shaped DataFrame."""
+    # Same hour as extract_features reads off the stored (UTC) datetime
+    hour = pd.to_datetime(counts['next_dose'], utc=True).dt.hour.to_numpy(dtype=float, na_value=np.nan)
+    features = features_from_counts(
+        counts['times_per_day'].to_numpy(),
+        *(counts[column].to_numpy() for column in COUNT_COLUMNS),
+        hour=hour,
+        index=counts.index,
+    )
+    features.insert(0, 'user_id', counts['user_id'])
     return features
+
+
+def extract_features_frame(medications=None, now=None):
+    """
+    extract_features for many medications at once: one DataFrame row per medication
+    (index: medication id) holding its owner's `user_id` and the schema's columns.
+    """
+    return features_from_frame(pair_counts(medications, now))
+
+
+def features_from_counts(dose_complexity, total, taken, recent, recent_taken, hour, index=None):
+    """
+    The schema's columns from per-row dose counts (arrays): logs so far and how many were
+    taken, the same over the last 4 days, and the (UTC) hour of the dose being predicted
+    (NaN: none upcoming). Every path to the model goes through here: training
+    (medicines.utils.training), extract_features and the feature store.
+    """
+    total, taken, recent, recent_taken, hour = (
+        np.asarray(values, dtype=float) for values in (total, taken, recent, recent_taken, hour)
+    )
+    features = pd.DataFrame(index=index)
+    features['dose_complexity'] = np.asarray(dose_complexity)
+    features['past_adherence_rate'] = np.divide(taken, total, out=np.ones_like(total), where=total > 0)
+    features['lifestyle_routine'] = ((recent > 0) & (recent_taken >= 0.8 * recent)).astype(int)
+
+    hour = np.where(np.isnan(hour), 8, hour)  # fallback: morning
+    time_of_day = np.select(
+        [(hour >= 5) & (hour < 12), (hour >= 12) & (hour < 17), (hour >= 17) & (hour < 21)],
+        TIME_OF_DAY[:3],
+        default='Night',
+    )
+    for name in TIME_OF_DAY:
+        features[name] = (time_of_day == name).astype(int)
+    return features[list(FEATURES.columns)]
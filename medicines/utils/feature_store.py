@@ -0,0 +1,133 @@
+"""
+Persisted adherence features. Each (user, medication) pair has one AdherenceFeatures row
+holding the counts that features_from_counts turns into the model's input, so scoring
+reads these rows instead of aggregating the DoseLog table.
+
+dose_events.dose_logs_changed recomputes the rows of the pairs whose logs changed
+(refresh_pair_features, one grouped aggregate over those medications' logs). What moves
+with the clock alone - logs passing into the past, the 4-day window and the next dose -
+is brought up to date when a row older than ADHERENCE_FEATURES_MAX_AGE_HOURS is read
+(advance_adherence_features): that reads only the logs scheduled since the row was
+computed or inside the window, through the unique_scheduled_dose index.
+"""
+from datetime import timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.db.models import F, Func, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from medicines.models import AdherenceFeatures, DoseLog, Medication
+from medicines.utils.feature_extractor import COUNT_COLUMNS, features_from_frame, pair_counts
+
+REFRESH_BATCH_USERS = 500
+REFRESH_BATCH_MEDICATIONS = 500
+
+
+def refresh_adherence_features(user_ids, now=None):
+    """Recompute the stored rows of these users' medications (one grouped query per batch); returns rows written."""
+    now = now or timezone.now()
+    user_ids = sorted(set(user_ids))
+    return sum(
+        _write_counts(Medication.objects.filter(user_id__in=user_ids[start:start + REFRESH_BATCH_USERS]), now)
+        for start in range(0, len(user_ids), REFRESH_BATCH_USERS)
+    )
+
+
+def refresh_pair_features(pairs, now=None):
+    """
+    Recompute the stored rows of these (user_id, medication_id) pairs, after their DoseLogs
+    changed. One grouped aggregate over just those medications' logs per batch.
+    """
+    now = now or timezone.now()
+    medication_ids = sorted({medication_id for user_id, medication_id in pairs})
+    return sum(
+        _write_counts(Medication.objects.filter(id__in=medication_ids[start:start + REFRESH_BATCH_MEDICATIONS]), now)
+        for start in range(0, len(medication_ids), REFRESH_BATCH_MEDICATIONS)
+    )
+
+
+def _write_counts(medications, now):
+    rows = [
+        AdherenceFeatures(
+            user_id=row.user_id,
+            medication_id=row.Index,
+            total=row.total,
+            taken=row.taken,
+            recent=row.recent,
+            recent_taken=row.recent_taken,
+            next_dose=None if pd.isna(row.next_dose) else row.next_dose,
+            computed_at=now,
+        )
+        for row in pair_counts(medications, now).itertuples()
+    ]
+    AdherenceFeatures.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'medication'],
+        update_fields=[*COUNT_COLUMNS, 'next_dose', 'computed_at'],
+    )
+    return len(rows)
+
+
+def _pair_logs(**filters):
+    return DoseLog.objects.filter(user_id=OuterRef('user_id'), medication_id=OuterRef('medication_id'), **filters).order_by()
+
+
+def _count_pair_logs(**filters):
+    # COUNT without GROUP BY, so a pair with no matching logs counts 0
+    return Subquery(_pair_logs(**filters).annotate(n=Func('id', function='COUNT')).values('n'))
+
+
+def advance_adherence_features(rows, now=None):
+    """
+    Bring stored rows (an AdherenceFeatures QuerySet) forward to `now` without recounting
+    their history: logs scheduled between computed_at and now are added to total/taken,
+    and the 4-day window and next dose are recomputed. One UPDATE; each row reads only
+    its pair's logs from computed_at (or the window start) on.
+    Relies on every DoseLog write going through dose_events, which recomputes the pair.
+    """
+    now = now or timezone.now()
+    four_days_ago = now - timedelta(days=4)
+    since_computed = {'scheduled_time__gte': OuterRef('computed_at'), 'scheduled_time__lt': now}
+    in_window = {'scheduled_time__gte': four_days_ago, 'scheduled_time__lt': now}
+    return rows.filter(computed_at__lt=now).update(
+        total=F('total') + Coalesce(_count_pair_logs(**since_computed), 0),
+        taken=F('taken') + Coalesce(_count_pair_logs(**since_computed, status='taken'), 0),
+        recent=Coalesce(_count_pair_logs(**in_window), 0),
+        recent_taken=Coalesce(_count_pair_logs(**in_window, status='taken'), 0),
+        next_dose=Subquery(_pair_logs(scheduled_time__gte=now).order_by('scheduled_time').values('scheduled_time')[:1]),
+        computed_at=now,
+    )
+
+
+def stored_features(medications=None, now=None, max_age=None):
+    """
+    Features of these medications (a QuerySet, default: all), shaped like
+    extract_features_frame. Missing rows are computed and rows older than `max_age` are
+    advanced to `now` first. Everything else is a single read.
+    """
+    now = now or timezone.now()
+    if max_age is None:
+        max_age = timedelta(hours=settings.ADHERENCE_FEATURES_MAX_AGE_HOURS)
+    if medications is None:
+        medications = Medication.objects.all()
+    medications = medications.filter(user__isnull=False)
+
+    refresh_adherence_features(
+        medications.filter(adherence_features__isnull=True).values_list('user_id', flat=True).distinct(), now,
+    )
+    advance_adherence_features(
+        AdherenceFeatures.objects.filter(medication__in=medications, computed_at__lt=now - max_age), now,
+    )
+
+    rows = (
+        AdherenceFeatures.objects
+        .filter(medication__in=medications, user_id=F('medication__user_id'))
+        .values_list('medication_id', 'user_id', 'medication__times_per_day', *COUNT_COLUMNS, 'next_dose')
+    )
+    counts = pd.DataFrame.from_records(
+        rows, columns=['medication_id', 'user_id', 'times_per_day', *COUNT_COLUMNS, 'next_dose'],
+    ).set_index('medication_id')
+    return features_from_frame(counts)
@@ -0,0 +1,152 @@
+"""
+Serving layer for the adherence model.
+
+The registry loads the artifact once per process (ideally at worker startup, see warm()),
+memory-maps its arrays so worker processes share the pages, and keeps loaded models keyed
+by version. When the file on disk changes, the one thread that notices loads the new
+version while the others keep serving the old one, then swaps it in atomically; requests
+already holding the old model finish with it. Writers should replace files atomically
+(write elsewhere, then os.replace), the artifact first and its metadata second.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+import joblib
+import pandas as pd
+from django.conf import settings
+
+from medicines.utils.feature_extractor import FEATURES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LoadedModel:
+    version: str
+    model: object
+    path: str
+    loaded_at: datetime
+    metadata: dict
+    stamp: tuple
+
+
+def metadata_path(path):
+    """Optional metadata next to the artifact (same name, .json), e.g. {"version": ..., "metrics": ...}."""
+    return os.path.splitext(path)[0] + '.json'
+
+
+def artifact_stamp(path):
+    """Changes whenever the artifact or its metadata file is replaced."""
+    stat = os.stat(path)
+    try:
+        metadata_mtime = os.stat(metadata_path(path)).st_mtime_ns
+    except OSError:
+        metadata_mtime = None
+    return stat.st_mtime_ns, stat.st_size, metadata_mtime
+
+
+def read_metadata(path):
+    try:
+        with open(metadata_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ModelRegistry:
+    def __init__(self, path, check_seconds=30.0, mmap_mode='r', keep_versions=2):
+        self.path = str(path)
+        self.check_seconds = check_seconds
+        self.mmap_mode = mmap_mode
+        self.keep_versions = keep_versions
+        self._models = OrderedDict()  # version -> LoadedModel, oldest first
+        self._current = None
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        stamp = artifact_stamp(self.path)
+        if self._current is not None and self._current.stamp == stamp:
+            return self._current
+        started = time.perf_counter()
+        metadata = read_metadata(self.path)
+        loaded = LoadedModel(
+            # The metadata's version if there is one, else one derived from the file
+            version=str(metadata.get('version') or f"{stamp[0]}-{stamp[1]}"),
+            model=joblib.load(self.path, mmap_mode=self.mmap_mode),
+            path=self.path,
+            loaded_at=datetime.now(),
+            metadata=metadata,
+            stamp=stamp,
+        )
+        version = loaded.version
+        # Publish: a single reference assignment, so readers see the old or the new model, never half of one
+        self._models[version] = loaded
+        while len(self._models) > self.keep_versions:
+            self._models.popitem(last=False)
+        self._current = loaded
+        logger.info("Loaded adherence model %s from %s in %.2f s", version, self.path, time.perf_counter() - started)
+        return loaded
+
+    def warm(self):
+        """Load the model now (worker startup) instead of on the first request; never raises."""
+        try:
+            with self._load_lock:
+                self._load()
+                self._checked_at = time.monotonic()
+        except Exception:
+            logger.exception("Could not load adherence model from %s", self.path)
+
+    def reload(self):
+        """Load the artifact again if its files changed; returns the current LoadedModel."""
+        with self._load_lock:
+            self._checked_at = time.monotonic()
+            return self._load()
+
+    def current(self):
+        """The latest loaded model, checking the file for a new version every `check_seconds`."""
+        current = self._current
+        if current is None:
+            return self.reload()
+        if time.monotonic() - self._checked_at >= self.check_seconds and self._load_lock.acquire(blocking=False):
+            # One thread checks and reloads; the others keep serving the model they have
+            try:
+                self._checked_at = time.monotonic()
+                current = self._load()
+            except Exception:
+                logger.exception("Could not reload adherence model from %s, keeping %s", self.path, current.version)
+            finally:
+                self._load_lock.release()
+        return current
+
+    def get(self, version=None):
+        """A loaded model by version (KeyError if it is no longer held), or the current one."""
+        if version is None:
+            return self.current()
+        return self._models[version]
+
+    def predict_many(self, features, version=None):
+        """
+        Miss-dose probabilities (class 1) for a feature DataFrame or a list of
+        extract_features dicts, from one predict_proba call. Returns (version, probabilities).
+        Safe to call from many threads: the fitted model is only read.
+        """
+        loaded = self.get(version)
+        model = loaded.model
+        if not isinstance(features, pd.DataFrame):
+            features = pd.DataFrame(list(features))
+        features = FEATURES.for_model(features, model)
+        probabilities = model.predict_proba(features)
+        return loaded.version, probabilities[:, list(model.classes_).index(1)]
+
+
+registry = ModelRegistry(
+    settings.ADHERENCE_MODEL_PATH,
+    check_seconds=settings.ADHERENCE_MODEL_CHECK_SECONDS,
+)
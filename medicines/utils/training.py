@@ -0,0 +1,204 @@
+"""
+Streaming training for the adherence model.
+
+Every resolved DoseLog (taken or missed) is one labelled example (missed = 1); pending logs
+are not, but count towards `total` for later doses as they do in extract_features. An
+example's features are what extract_features would have returned just before that dose: the pair's earlier logs, the ones from the last 4
+days, and the dose's hour. They go through the same features_from_counts. Months that
+compact_dose_logs archived are no longer examples; their counts (MonthlyAdherence) are
+added to each later log's `total` and `taken`, as serving does.
+
+Logs are read in (user, medication, scheduled_time) order, which the unique_scheduled_dose
+index already provides. Reads go a chunk at a time, and a chunk is cut where one pair ends
+and the next begins. An SGDClassifier (logistic loss) learns each chunk with partial_fit.
+Memory depends on the chunk size and the holdout window, not the table size. The one
+exception is a single pair whose history is longer than a chunk, since a chunk always
+holds a whole pair.
+"""
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.db import connection
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, brier_score_loss, log_loss, roc_auc_score
+
+from medicines.models import DoseLog, Medication
+from medicines.utils.feature_extractor import FEATURES, archived_counts, features_from_counts
+from medicines.utils.model_registry import metadata_path
+
+RECENT_SECONDS = 4 * 24 * 3600  # extract_features' "last 4 days"
+
+
+def iter_dose_chunks(as_of, chunk_size=50_000, user_ids=None):
+    """
+    DataFrames of (user_id, medication_id, scheduled_time, taken, missed) for the logs scheduled
+    before `as_of` (of `user_ids` only, if given), about `chunk_size` rows each, in index
+    order, each holding whole pairs.
+    Reads go through the raw cursor: datetimes parsed by pandas per chunk cost a
+    fraction of Django's per-row conversion.
+    """
+    queryset = DoseLog.objects.filter(scheduled_time__lt=as_of)
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    queryset = (
+        queryset
+        .order_by('user_id', 'medication_id', 'scheduled_time')
+        .values_list('user_id', 'medication_id', 'scheduled_time', 'status')
+    )
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        pending = []
+        for batch in iter(lambda: cursor.fetchmany(chunk_size), []):
+            pending.extend(batch)
+            # The last pair may continue in the next batch: hold it back
+            last_pair = pending[-1][:2]
+            cut = len(pending)
+            while cut and pending[cut - 1][:2] == last_pair:
+                cut -= 1
+            if cut:
+                yield _chunk_frame(pending[:cut])
+                pending = pending[cut:]
+        if pending:
+            yield _chunk_frame(pending)
+
+
+def _chunk_frame(rows):
+    chunk = pd.DataFrame.from_records(rows, columns=['user_id', 'medication_id', 'scheduled_time', 'status'])
+    chunk['scheduled_time'] = pd.to_datetime(chunk['scheduled_time'], utc=True, format='ISO8601')
+    status = chunk.pop('status')
+    chunk['taken'] = (status == 'taken').to_numpy(dtype=np.int8)
+    chunk['missed'] = (status == 'missed').to_numpy(dtype=np.int8)
+    return chunk
+
+
+def chunk_examples(chunk, times_per_day, archived=None):
+    """
+    Features (in FEATURES order) and labels for every log in a chunk of whole pairs, each
+    log's features counting only the logs of its pair scheduled before it, plus the pair's
+    archived months if `archived` (archived_counts) is given. Pending logs get label 0
+    here; iter_examples leaves them out.
+    """
+    n = len(chunk)
+    position = np.arange(n)
+    user_id = chunk['user_id'].to_numpy()
+    medication_id = chunk['medication_id'].to_numpy()
+    new_pair = np.ones(n, dtype=bool)
+    new_pair[1:] = (user_id[1:] != user_id[:-1]) | (medication_id[1:] != medication_id[:-1])
+    pair = np.cumsum(new_pair) - 1
+    pair_start = np.flatnonzero(new_pair)[pair]
+
+    missed = chunk['missed'].to_numpy()
+    taken_before = np.concatenate([[0], np.cumsum(chunk['taken'].to_numpy())])  # taken_before[i]: taken among rows < i
+
+    # The window [t - 4 days, t) of each log, found within its own pair: shift each pair
+    # onto its own stretch of a single increasing axis and binary-search it
+    seconds = chunk['scheduled_time'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    seconds -= seconds.min()
+    axis = pair * (int(seconds.max()) + RECENT_SECONDS + 1) + seconds
+    window_start = np.searchsorted(axis, axis - RECENT_SECONDS, side='left')
+
+    archived_total = archived_taken = 0
+    if archived is not None and len(archived):
+        prior = archived.reindex(pd.MultiIndex.from_arrays([user_id, medication_id])).fillna(0)
+        archived_total, archived_taken = prior['total'].to_numpy(), prior['taken'].to_numpy()
+
+    features = features_from_counts(
+        pd.Series(medication_id).map(times_per_day).fillna(1).to_numpy(),
+        total=position - pair_start + archived_total,
+        taken=taken_before[position] - taken_before[pair_start] + archived_taken,
+        recent=position - window_start,
+        recent_taken=taken_before[position] - taken_before[window_start],
+        hour=chunk['scheduled_time'].dt.hour.to_numpy(),
+    )
+    return features, missed
+
+
+def iter_examples(as_of, holdout_from, chunk_size=50_000):
+    """
+    (features, labels, is_holdout) of the resolved logs of each chunk; holdout = logs
+    scheduled at or after `holdout_from`.
+    """
+    times_per_day = dict(Medication.objects.values_list('id', 'times_per_day'))
+    archived = archived_counts()  # one row per pair with archived months
+    for chunk in iter_dose_chunks(as_of, chunk_size):
+        features, labels = chunk_examples(chunk, times_per_day, archived)
+        resolved = ((chunk['taken'] + chunk['missed']) > 0).to_numpy()
+        holdout = (chunk['scheduled_time'] >= holdout_from).to_numpy()
+        yield features[resolved].reset_index(drop=True), labels[resolved], holdout[resolved]
+
+
+def train_model(as_of, holdout_from, chunk_size=50_000, epochs=1, seed=0, alpha=1e-4):
+    """
+    Fit an SGDClassifier on the logs before `holdout_from`, `epochs` streaming passes,
+    each chunk shuffled with a seeded generator: the same history, seed and chunk size
+    give the same model. The held-out logs' features are kept from the last pass (the
+    holdout window is a few days, not the history) for evaluate_model.
+    Returns (model, training stats, (holdout features, holdout labels)).
+    ValueError if there is nothing to train on.
+    """
+    model = SGDClassifier(loss='log_loss', alpha=alpha, random_state=seed)
+    rng = np.random.default_rng(seed)
+    classes = np.array([0, 1])
+    examples = misses = 0
+    for epoch in range(epochs):
+        holdout_features, holdout_labels = [], []
+        for features, labels, holdout in iter_examples(as_of, holdout_from, chunk_size):
+            if holdout.any():
+                holdout_features.append(features[holdout].astype(np.float32))
+                holdout_labels.append(labels[holdout])
+            features, labels = features[~holdout], labels[~holdout]
+            if not len(labels):
+                continue
+            order = rng.permutation(len(labels))
+            model.partial_fit(features.iloc[order], labels[order], classes=classes)
+            if epoch == 0:
+                examples += len(labels)
+                misses += int(labels.sum())
+    if not examples:
+        raise ValueError(f"No dose logs scheduled before {holdout_from} to train on")
+
+    holdout = (
+        pd.concat(holdout_features, ignore_index=True) if holdout_features else pd.DataFrame(columns=list(FEATURES.columns)),
+        np.concatenate(holdout_labels) if holdout_labels else np.array([], dtype=np.int8),
+    )
+    return model, {'examples': examples, 'miss_rate': misses / examples, 'epochs': epochs}, holdout
+
+
+def evaluate_model(model, features, labels):
+    """Holdout metrics of `model`: log loss, Brier score, accuracy at 0.5 and ROC AUC."""
+    if not len(labels):
+        return {'examples': 0}
+    probabilities = model.predict_proba(FEATURES.for_model(features, model))[:, list(model.classes_).index(1)]
+    return {
+        'examples': len(labels),
+        'miss_rate': float(labels.mean()),
+        'log_loss': float(log_loss(labels, probabilities, labels=[0, 1])),
+        'brier': float(brier_score_loss(labels, probabilities)),
+        'accuracy': float(accuracy_score(labels, probabilities >= 0.5)),
+        # Undefined with a single class in the window
+        'roc_auc': float(roc_auc_score(labels, probabilities)) if 0 < labels.sum() < len(labels) else None,
+    }
+
+
+def save_artifact(model, metadata, path):
+    """
+    Write the model to `path` and its metadata next to it (see model_registry.metadata_path),
+    each through a temporary file and os.replace, the artifact first: the order ModelRegistry
+    expects, so a serving process never loads a half-written file.
+    """
+    path = str(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    joblib.dump(model, tmp)
+    os.replace(tmp, path)
+
+    meta_path = metadata_path(path)
+    tmp = f"{meta_path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.replace(tmp, meta_path)
+
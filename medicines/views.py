@@ -1,4 +1,8 @@
-from .models import Medication, DoseLog, PushSubscription, GoogleCredentials,OTP
+from .models import Medication, DoseLog, PushSubscription, GoogleCredentials,OTP, DailyAdherence, DoseSchedule, minute_on_day, time_to_minute, times_to_minutes
+from .adherence import adherence_totals, local_day, recent_dose_history
+from .dose_events import dose_log_changed, dose_logs_changed
+from .dashboard_cache import cache_stats, dashboard_etag, get_dashboard
+from .dose_stream import broker, sse_event
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout, authenticate
@@ -6,12 +10,17 @@ from django.contrib.auth.models import User
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import reverse
+import asyncio
 import json
+from collections import defaultdict
+import time
 from datetime import date, datetime, timedelta
+from asgiref.sync import sync_to_async
 
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -39,8 +48,11 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import etag, require_http_methods
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
 from django import forms
 
 
@@ -128,11 +140,9 @@ def _create_google_events(user, med, service=None):
     
     today = timezone.localdate()
 
-    for t_str in med.times:
-        time_obj = datetime.strptime(t_str, "%H:%M").time()
+    for minute in med.schedule.order_by('minute_of_day').values_list('minute_of_day', flat=True):
         # Events must start from the earliest time possible today in the user's timezone (Asia/Kolkata)
-        start_datetime_local = datetime.combine(today, time_obj)
-        start_datetime = timezone.make_aware(start_datetime_local)
+        start_datetime = minute_on_day(today, minute)
         
         # End time is 30 minutes later
         end_datetime = start_datetime + timedelta(minutes=30) 
@@ -335,6 +345,11 @@ def medication_create(request):
         if not pill_name or not dosage or not times:
             messages.error(request, "Please fill all required fields.")
             return redirect('med_add')
+        try:
+            times_to_minutes(times)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return redirect('med_add')
 
         Medication.objects.create(
             user=request.user,
@@ -376,6 +391,12 @@ def medication_update(request, pk):
         if med.times_per_day == 0:
             messages.error(request, 'At least one time is required.')
             return render(request, 'medicines/medication_form.html', {'med': med})
+        # Before touching the calendar: save() would reject them anyway
+        try:
+            times_to_minutes(submitted_times)
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+            return render(request, 'medicines/medication_form.html', {'med': med})
             
         # Determine if calendar event action is required
         schedule_changed = (submitted_times != old_times) or (new_frequency != old_frequency)
@@ -463,46 +484,81 @@ def get_vapid_public_key(request):
 # ===========================
 # DASHBOARD VIEWS
 # ===========================
-@login_required
-def dashboard_view(request):
-    meds = Medication.objects.filter(user=request.user)
-    today = date.today()
+def _build_dashboard(user):
+    """
+    Compute today's dashboard for `user` (creating missing DoseLogs and marking overdue
+    ones missed on the way). Returns (data, seconds the data stays valid), for
+    dashboard_cache.get_dashboard.
+    """
+    today = timezone.localdate()
     now = timezone.now()
 
-    dose_data = []
-    for med in meds:
-        # Safety check: Ensure med.times is a list before iterating
-        times_list = med.times if isinstance(med.times, list) else [] 
-        
-        for t_str in times_list:
-            t_obj = datetime.strptime(t_str, "%H:%M").time()
-            scheduled_dt = timezone.make_aware(datetime.combine(today, t_obj))
-            
-            # ALWAYS create DoseLog entry to ensure we have an ID
-            dose_log, created = DoseLog.objects.get_or_create(
-                user=request.user,
-                medication=med,
-                scheduled_time=scheduled_dt,
-                defaults={'status': 'pending'}
-            )
-            
-            # Auto-mark as missed if time has passed and still pending
-            if dose_log.status == 'pending' and scheduled_dt < now:
-                dose_log.status = 'missed'
-                dose_log.save()
-            
-            dose_data.append({
-                'med_id': med.id,
-                'pill_name': med.pill_name,
-                'time': t_str,
-                'status': dose_log.status,
-                'dose_log_id': dose_log.id 
-            })
+    today_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+    today_end = timezone.make_aware(datetime.combine(today, datetime.max.time()))
+    window_start = timezone.make_aware(datetime.combine(today - timedelta(days=29), datetime.min.time()))
+
+    logs = list(DoseLog.objects.filter(
+        user=user,
+        scheduled_time__range=(today_start, today_end)
+    ))
+
+    # Today's schedule in time order: (med, time string, scheduled datetime), from the
+    # DoseSchedule minute index rather than parsing every Medication.times string
+    schedule = [
+        (row.medication, row.time_str, row.scheduled_on(today))
+        for row in DoseSchedule.objects
+        .filter(medication__user=user)
+        .select_related('medication')
+        .order_by('minute_of_day', 'medication_id')
+    ]
+
+    changed_days = set()
+    changed_meds = set()
+
+    # ALWAYS have a DoseLog entry to ensure we have an ID: create the missing ones in one go
+    logs_by_key = {(log.medication_id, log.scheduled_time): log for log in logs}
+    missing = [
+        DoseLog(user=user, medication=med, scheduled_time=scheduled_dt, status='pending')
+        for med, t_str, scheduled_dt in schedule
+        if (med.id, scheduled_dt) not in logs_by_key
+    ]
+    if missing:
+        DoseLog.objects.bulk_create(missing, ignore_conflicts=True)
+        logs = list(DoseLog.objects.filter(
+            user=user,
+            scheduled_time__range=(today_start, today_end)
+        ))
+        logs_by_key = {(log.medication_id, log.scheduled_time): log for log in logs}
+        changed_days.add(today)
+        changed_meds |= {log.medication_id for log in missing}
+
+    # Auto-mark as missed if time has passed and still pending (single UPDATE)
+    stale = DoseLog.objects.filter(
+        user=user,
+        status='pending',
+        scheduled_time__range=(window_start, now)
+    )
+    stale_rows = list(stale.values_list('scheduled_time', 'medication_id'))
+    if stale_rows:
+        stale.update(status='missed')
+        changed_days |= {local_day(t) for t, med_id in stale_rows}
+        changed_meds |= {med_id for t, med_id in stale_rows}
+    for log in logs:
+        if log.status == 'pending' and log.scheduled_time < now:
+            log.status = 'missed'
 
-    # --- PRIMARY CHANGE FOR SEQUENTIAL ORDER ---
-    # Sort dose_data by time string (e.g., "08:00" comes before "12:00")
-    dose_data.sort(key=lambda x: x['time']) 
-    # -------------------------------------------
+    dose_logs_changed(((user.id, day) for day in changed_days), pairs=((user.id, med_id) for med_id in changed_meds))
+
+    dose_data = []
+    for med, t_str, scheduled_dt in schedule:
+        dose_log = logs_by_key[(med.id, scheduled_dt)]
+        dose_data.append({
+            'med_id': med.id,
+            'pill_name': med.pill_name,
+            'time': t_str,
+            'status': dose_log.status,
+            'dose_log_id': dose_log.id 
+        })
 
     # Calculate adherence
     total_doses = len(dose_data)
@@ -510,42 +566,32 @@ def dashboard_view(request):
     missed_doses = sum(1 for d in dose_data if d['status'] == 'missed')
     adherence = round((taken_doses / total_doses) * 100, 1) if total_doses else 0
 
+    # Taken doses per local day, read from the DailyAdherence rollup
+    taken_by_day = dict(
+        DailyAdherence.objects
+        .filter(user=user, date__range=(today - timedelta(days=29), today))
+        .values_list('date', 'taken')
+    )
+
+    # We need to consider all possible scheduled doses for that day
+    expected_doses_count = len(schedule)
+
     # Calculate streak
     streak = 0
-    # Use a set of all unique medications to calculate expected doses per day
-    all_meds = Medication.objects.filter(user=request.user)
-    
     for i in range(30):
         day = today - timedelta(days=i)
-        day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
-        day_end = timezone.make_aware(datetime.combine(day, datetime.max.time()))
-        
-        # We need to consider all possible scheduled doses for that day
-        expected_doses_count = sum(len(m.times) for m in all_meds if isinstance(m.times, list))
-        
-        # Check the logs for that specific day
-        day_logs = DoseLog.objects.filter(
-            user=request.user, 
-            # Note: scheduled_time is used to track the *intended* date
-            scheduled_time__range=(day_start, day_end) 
-        )
-
-        taken_doses_count = day_logs.filter(status='taken').count()
-        
         # A perfect day means all expected doses for that day were taken
-        if expected_doses_count > 0 and taken_doses_count == expected_doses_count:
+        if expected_doses_count > 0 and taken_by_day.get(day, 0) == expected_doses_count:
             streak += 1
         else:
             break
 
     # Next dose
     next_dose_time = "--:--"
-    # Iterate over the sorted dose_data for the nearest upcoming dose
-    for d in dose_data:
-        dose_time_obj = datetime.strptime(d['time'], "%H:%M").time()
-        scheduled_dt = timezone.make_aware(datetime.combine(today, dose_time_obj))
+    # Iterate over the sorted schedule for the nearest upcoming dose
+    for (med, t_str, scheduled_dt), d in zip(schedule, dose_data):
         if scheduled_dt > now and d['status'] == 'pending':
-            next_dose_time = d['time']
+            next_dose_time = t_str
             break
 
     # Weekly adherence data
@@ -555,35 +601,102 @@ def dashboard_view(request):
         day = today - timedelta(days=i)
         week_days.append(day.strftime('%a'))
         
-        day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
-        day_end = timezone.make_aware(datetime.combine(day, datetime.max.time()))
-        
-        day_logs = DoseLog.objects.filter(
-            user=request.user, 
-            scheduled_time__range=(day_start, day_end)
-        )
-        
-        expected_doses = sum(len(m.times) for m in all_meds if isinstance(m.times, list))
-        taken_doses_for_day = day_logs.filter(status='taken').count()
-        
-        day_adherence = round((taken_doses_for_day / expected_doses) * 100, 1) if expected_doses > 0 else 0
+        taken_doses_for_day = taken_by_day.get(day, 0)
+        day_adherence = round((taken_doses_for_day / expected_doses_count) * 100, 1) if expected_doses_count > 0 else 0
         weekly_adherence.append(day_adherence)
 
-    context = {
-        'meds': meds,
+    # Valid until the next dose of today comes due (its status flips then), else until midnight
+    upcoming = [scheduled_dt for med, t_str, scheduled_dt in schedule if scheduled_dt > now]
+    expires = min(upcoming) if upcoming else today_end
+    timeout = (expires - now).total_seconds()
+
+    data = {
         'dose_data': dose_data,
-        'dose_data_json': json.dumps(dose_data),
         'adherence': adherence,
         'streak': streak,
         'next_dose': next_dose_time,
         'total_doses': total_doses,
         'taken_doses': taken_doses,
         'missed_doses': missed_doses,
-        'weekly_adherence_json': json.dumps(weekly_adherence),
-        'week_days_json': json.dumps(week_days),
+        'weekly_adherence': weekly_adherence,
+        'week_days': week_days,
+    }
+    return data, timeout
+
+
+@login_required
+def dashboard_view(request):
+    data = get_dashboard(request.user.id, timezone.localdate(), lambda: _build_dashboard(request.user))
+
+    context = {
+        'meds': Medication.objects.filter(user=request.user),
+        'dashboard_version': dashboard_etag(request.user.id, timezone.localdate()),
+        'dose_data': data['dose_data'],
+        'dose_data_json': json.dumps(data['dose_data']),
+        'adherence': data['adherence'],
+        'streak': data['streak'],
+        'next_dose': data['next_dose'],
+        'total_doses': data['total_doses'],
+        'taken_doses': data['taken_doses'],
+        'missed_doses': data['missed_doses'],
+        'weekly_adherence_json': json.dumps(data['weekly_adherence']),
+        'week_days_json': json.dumps(data['week_days']),
     }
     return render(request, "medicines/dashboard.html", context)
 
+def _dashboard_state(user):
+    """(version, when the next pending dose comes due) of the user's cached dashboard."""
+    today = timezone.localdate()
+    data = get_dashboard(user.id, today, lambda: _build_dashboard(user))
+    now = timezone.now()
+    due = [minute_on_day(today, time_to_minute(d['time'])) for d in data['dose_data'] if d['status'] == 'pending']
+    # At midnight the dashboard moves on to the next day
+    tomorrow = timezone.make_aware(datetime.combine(today + timedelta(days=1), datetime.min.time()))
+    return dashboard_etag(user.id, today), min([t for t in due if t > now], default=tomorrow)
+
+
+async def _dose_status_events(user):
+    version, next_due = await sync_to_async(_dashboard_state)(user)
+    with broker.subscribe(user.id) as queue:
+        yield sse_event('dose_status', {'version': version, 'dates': [], 'doses': []})
+        last_write = time.monotonic()
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), settings.DOSE_STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                event = None
+
+            if event is None and timezone.now() >= next_due:
+                # A dose coming due changes statuses without any write. Changes made by other
+                # processes arrive as events from the broker's version poller.
+                current, next_due = await sync_to_async(_dashboard_state)(user)
+                if current != version:
+                    event = {'version': current, 'dates': [], 'doses': []}
+            if event is not None and event['version'] == version and not event['doses']:
+                event = None  # the version poller confirming what this stream already sent
+
+            if event is not None:
+                version = event['version']
+                yield sse_event('dose_status', event)
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= settings.DOSE_STREAM_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+
+
+@login_required
+async def dose_status_stream(request):
+    """
+    Server-sent events carrying the user's dose-status changes, so open dashboards update
+    without polling. Needs the ASGI server (crudapp/asgi.py).
+    """
+    user = await request.auser()
+    return StreamingHttpResponse(
+        _dose_status_events(user),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # ===========================
 # TOGGLE DOSE STATUS
 # ===========================
@@ -614,6 +727,7 @@ def toggle_dose_status(request):
                 dose_log.timestamp = timezone.now()
             
             dose_log.save()
+            dose_log_changed(dose_log)
             
             return JsonResponse({
                 'status': 'success',
@@ -627,30 +741,34 @@ def toggle_dose_status(request):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid method'})
 
+def _request_dashboard(request):
+    """
+    Today's dashboard for the request's user, kept on the request. A build that marks doses
+    missed bumps the version, so it isn't cached: the ETag check and the view must share
+    this one result rather than each call get_dashboard.
+    """
+    if not hasattr(request, '_dashboard'):
+        request._dashboard = get_dashboard(request.user.id, timezone.localdate(), lambda: _build_dashboard(request.user))
+    return request._dashboard
+
+
+def _dashboard_data_etag(request):
+    # Bring the cached dashboard up to date first: doses coming due change statuses
+    # (and the version) without any request writing to them
+    _request_dashboard(request)
+    return dashboard_etag(request.user.id, timezone.localdate())
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@etag(_dashboard_data_etag)
 def dashboard_data(request):
-    meds = Medication.objects.filter(user=request.user)
-    today = date.today()
-
-    dose_data = []
-    for med in meds:
-        # Safety check: Ensure med.times is a list before iterating
-        times_list = med.times if isinstance(med.times, list) else [] 
-        for t_str in times_list:
-            t_obj = datetime.strptime(t_str, "%H:%M").time()
-            scheduled_dt = timezone.make_aware(datetime.combine(today, t_obj))
-            try:
-                log = DoseLog.objects.get(user=request.user, medication=med, scheduled_time=scheduled_dt)
-                status = log.status
-            except DoseLog.DoesNotExist:
-                status = 'pending'
-            dose_data.append({
-                'med_id': med.id,
-                'pill_name': med.pill_name,
-                'time': t_str,
-                'status': status
-            })
+    data = _request_dashboard(request)
 
+    dose_data = [
+        {'med_id': d['med_id'], 'pill_name': d['pill_name'], 'time': d['time'], 'status': d['status']}
+        for d in data['dose_data']
+    ]
     taken_count = sum(1 for d in dose_data if d['status'] == 'taken')
     missed_count = sum(1 for d in dose_data if d['status'] == 'missed')
     pending_count = sum(1 for d in dose_data if d['status'] == 'pending')
@@ -664,6 +782,14 @@ def dashboard_data(request):
     })
 
 
+@login_required
+def dashboard_cache_stats(request):
+    """Hit rate of the per-user dashboard cache (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Access denied'}, status=403)
+    return JsonResponse(cache_stats())
+
+
 # ===========================
 # DOSE LOG AJAX 
 # ===========================
@@ -678,12 +804,13 @@ def log_dose(request):
             scheduled_dt = timezone.make_aware(datetime.combine(date.today(), dose_time))
             status = 'taken' if data.get('taken', True) else 'missed'
 
-            DoseLog.objects.update_or_create(
+            dose_log, created = DoseLog.objects.update_or_create(
                 user=request.user,
                 medication=med,
                 scheduled_time=scheduled_dt,
                 defaults={'status': status}
             )
+            dose_log_changed(dose_log)
             return JsonResponse({'status': 'success', 'message': 'Dose logged successfully'})
         except Medication.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Medication not found'}, status=404)
@@ -709,6 +836,7 @@ def mark_dose_taken(request):
             dose_log.status = 'taken'
             dose_log.timestamp = timezone.now()  # Update timestamp to when taken
             dose_log.save()
+            dose_log_changed(dose_log)
             
             return JsonResponse({
                 'status': 'success', 
@@ -733,18 +861,150 @@ def mark_dose_taken(request):
 
 
 # ===========================
-# GET TODAY'S DOSE LOGS
+# BATCH DOSE LOGGING (offline replay)
 # ===========================
+BATCH_DOSE_LIMIT = 500
+
+
+def _parse_batch_item(item):
+    """('log', dose_log_id, status) or ('slot', (med_id, scheduled datetime), status); raises ValueError."""
+    if not isinstance(item, dict) or item.get('status') not in ('taken', 'missed'):
+        raise ValueError("status must be 'taken' or 'missed'")
+    try:
+        if 'dose_log_id' in item:
+            return 'log', int(item['dose_log_id']), item['status']
+        day = date.fromisoformat(item['date']) if item.get('date') else timezone.localdate()
+        return 'slot', (int(item['med_id']), minute_on_day(day, time_to_minute(item['time']))), item['status']
+    except (KeyError, TypeError, AttributeError, ValueError):
+        raise ValueError("expected {dose_log_id, status} or {med_id, time, status}")
+
+
 @login_required
-def get_today_dose_logs(request):
-    today = date.today()
+@csrf_exempt
+def batch_log_doses(request):
+    """
+    Apply dose actions queued by an offline client in one transaction. Body:
+    {"items": [{"dose_log_id", "status"} | {"med_id", "time": "HH:MM", "date"?: "YYYY-MM-DD", "status"}]}
+    Items are applied in order (a later item for the same dose wins); the response holds
+    one result per item.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
+    try:
+        items = json.loads(request.body).get('items')
+    except (ValueError, AttributeError):
+        items = None
+    if not isinstance(items, list):
+        return JsonResponse({'status': 'error', 'message': 'Expected {"items": [...]}'}, status=400)
+    if len(items) > BATCH_DOSE_LIMIT:
+        return JsonResponse({'status': 'error', 'message': f'At most {BATCH_DOSE_LIMIT} items per batch'}, status=400)
+
+    results = [None] * len(items)
+    parsed = {}
+    for i, item in enumerate(items):
+        try:
+            parsed[i] = _parse_batch_item(item)
+        except ValueError as e:
+            results[i] = {'status': 'error', 'message': str(e)}
+
+    # Ownership and existing rows: one query per kind of item, however long the batch
+    log_ids = {key for kind, key, status in parsed.values() if kind == 'log'}
+    slots = {key for kind, key, status in parsed.values() if kind == 'slot'}
+    logs_by_id = {log.id: log for log in DoseLog.objects.filter(user=request.user, id__in=log_ids)} if log_ids else {}
+    owned_meds = set(
+        Medication.objects.filter(user=request.user, id__in={med_id for med_id, t in slots})
+        .values_list('id', flat=True)
+    ) if slots else set()
+    if owned_meds:
+        for log in DoseLog.objects.filter(
+            user=request.user,
+            medication_id__in=owned_meds,
+            scheduled_time__in={t for med_id, t in slots},
+        ):
+            logs_by_id.setdefault(log.id, log)
+    log_by_slot = {(log.medication_id, log.scheduled_time): log for log in logs_by_id.values()}
+
+    # Resolve every item to an existing DoseLog id or a new slot; the last item for a dose decides its status
+    final_status = {}
+    members = defaultdict(list)
+    for i, (kind, key, status) in parsed.items():
+        if kind == 'log':
+            if key not in logs_by_id:
+                results[i] = {'status': 'error', 'message': 'Dose not found'}
+                continue
+        elif key[0] not in owned_meds:
+            results[i] = {'status': 'error', 'message': 'Medication not found'}
+            continue
+        elif key in log_by_slot:
+            key = log_by_slot[key].id
+        final_status[key] = status
+        members[key].append(i)
+
+    now = timezone.now()
+    to_update, to_create = [], []
+    log_for_key = {}
+    for key, status in final_status.items():
+        if isinstance(key, tuple):
+            med_id, scheduled_dt = key
+            log = DoseLog(user=request.user, medication_id=med_id, scheduled_time=scheduled_dt, status=status)
+            to_create.append(log)
+        else:
+            log = logs_by_id[key]
+            log.status = status
+            if status == 'taken':
+                log.timestamp = now
+            to_update.append(log)
+        log_for_key[key] = log
+
+    try:
+        with transaction.atomic():
+            DoseLog.objects.bulk_update(to_update, ['status', 'timestamp'])
+            DoseLog.objects.bulk_create(to_create)
+    except IntegrityError:
+        # A dose in the batch was logged concurrently (e.g. by the reminder worker); nothing was applied
+        return JsonResponse({'status': 'error', 'message': 'Conflicting update, retry the batch'}, status=409)
+
+    for key, log in log_for_key.items():
+        for i in members[key]:
+            results[i] = {'status': 'success', 'dose_log_id': log.id, 'new_status': log.status}
+    touched = list(log_for_key.values())
+    dose_logs_changed({(request.user.id, local_day(log.scheduled_time)) for log in touched}, touched)
+
+    return JsonResponse({
+        'status': 'success',
+        'applied': sum(1 for r in results if r['status'] == 'success'),
+        'results': results,
+    })
+
+
+# ===========================
+# GET TODAY'S DOSE LOGS
+# ===========================
+def _today_dose_logs(user):
+    today = timezone.localdate()
     today_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
     today_end = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-    
-    dose_logs = DoseLog.objects.filter(
-        user=request.user,
-        scheduled_time__range=(today_start, today_end)
-    ).select_related('medication')
+    return DoseLog.objects.filter(user=user, scheduled_time__range=(today_start, today_end))
+
+
+def _today_dose_logs_etag(request):
+    # The cache version alone misses writes from other processes (the reminder worker)
+    # unless the cache is shared, so add a fingerprint of today's rows: one aggregate over
+    # the (user, scheduled_time) index, covering inserts and status changes
+    rows = _today_dose_logs(request.user).aggregate(
+        count=Count('id'),
+        last_id=Max('id'),
+        taken=Count('id', filter=Q(status='taken')),
+        missed=Count('id', filter=Q(status='missed')),
+    )
+    return "{}-{count}-{last_id}-{taken}-{missed}".format(dashboard_etag(request.user.id, timezone.localdate()), **rows)
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@etag(_today_dose_logs_etag)
+def get_today_dose_logs(request):
+    dose_logs = _today_dose_logs(request.user).select_related('medication')
     
     logs_data = []
     for log in dose_logs:
@@ -903,14 +1163,12 @@ def chatbot_view(request):
 
 def get_patient_stats(user):
     """A systematic calculation tool to pull data logs for standard patient review."""
-    from datetime import date, timedelta
-    logs = DoseLog.objects.filter(user=user)
-    total = logs.count()
-    taken = logs.filter(status='taken').count()
+    # Totals come from the monthly and daily rollups instead of counting the raw history
+    total, taken = adherence_totals(user)
     adherence = round((taken / total) * 100, 1) if total else 0
 
     # Detailed medical history for doctor reflection
-    detailed_history = logs.order_by('-scheduled_time')[:10] 
+    detailed_history = recent_dose_history(user, 10)
 
     return {
         'adherence': adherence,
@@ -1317,7 +1575,8 @@ class ChatbotView(APIView):
             result = chatbot.process(
                 user_input=message,
                 user_id=user_id,
-                context=context
+                context=context,
+                remember=request.user.is_authenticated
             )
             
             # Add request metadata
@@ -1,3 +1,5 @@
+# Prototype on dummy data. The served model is trained from DoseLog history with
+# `python manage.py train_adherence_model` (medicines/utils/training.py).
 #  features of model :  "time_of_day", "dose_complexity", "past_adherence_rate", "lifestyle_routine"
 # mapping :-
 # lifestyle routine : {"regular": 1 , irregualr:0}
@@ -37,10 +39,14 @@ X=data.drop(columns="will_miss_dose")
 Y=data["will_miss_dose"]
 
 # one hot encoding for "time_of_day" & "lifestyle_routine"
-dummies=pd.get_dummies(X.time_of_day)
+# (reindexed: get_dummies only creates the columns present in the data, in its own order)
+TIME_OF_DAY = ["Morning", "Afternoon", "Evening", "Night"]
+dummies=pd.get_dummies(X.time_of_day).reindex(columns=TIME_OF_DAY, fill_value=0).astype(int)
 
 X=X.drop(columns="time_of_day")
 X=pd.concat([X,dummies], axis='columns')
+# Same columns, same order as medicines.utils.feature_extractor.FEATURES
+X=X[["dose_complexity", "past_adherence_rate", "lifestyle_routine", *TIME_OF_DAY]]
 
 from sklearn.model_selection import train_test_split
 x_train, x_test, y_train , y_test = train_test_split(X, Y, test_size=0.2)